@@ -0,0 +1,213 @@
+"""
+Drives scripted /lowprice and /bestdeal conversations through the bot offline: the hotels api and the Telegram Bot API
+are local stub servers, redis is replaced with an in-memory stand-in. Updates go through the same dispatcher as in
+production, a step ends when its handler has returned and every message it sent has been delivered.
+
+Reports search latency percentiles, throughput, and redis, hotels api and Telegram calls per search.
+
+Usage: python -m benchmarks.bench_bot [--conversations 200] [--concurrency 20] [--scenario mixed]
+       [--cities 10] [--api-latency 0.2] [--telegram-latency 0.02] [--api-rate 1000] [--fixtures DIR]
+"""
+import argparse
+import itertools
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Event, Lock
+
+from benchmarks.memredis import MemoryRedis
+from benchmarks.stubs import HotelsApiStub, TelegramStub
+from tests.helpers import cas_state
+
+CITIES = ('Moscow', 'London', 'Paris', 'Berlin', 'Rome', 'Madrid', 'Prague', 'Vienna', 'Kazan', 'Sochi', 'Riga',
+          'Oslo', 'Lisbon', 'Dublin', 'Warsaw', 'Athens')
+
+scenarios = {
+    'lowprice': ('/lowprice', '{city}', 'press', '5'),
+    'bestdeal': ('/bestdeal', '{city}', 'press', '100 1000', '3', '5'),
+}
+
+
+def percentiles(values: list[float]) -> str:
+    values = sorted(values)
+    if not values:
+        return '-'
+    return '  '.join(f'p{percentile} {values[len(values) * percentile // 100] * 1000:7.1f} ms'
+                     for percentile in (50, 95, 99))
+
+
+class Driver:
+    """
+    Sends updates of scripted conversations to the bot and waits for their handling
+    """
+
+    def __init__(self, bot_main, telegram: TelegramStub, workers: int) -> None:
+        from telebot.types import Update
+        from utils.dispatcher import ChatDispatcher
+
+        self.main = bot_main
+        self.telegram = telegram
+        self.update_type = Update
+        self.update_ids = itertools.count(1)
+        self.handled = {}
+        self.sent = defaultdict(list)
+        self.lock = Lock()
+
+        queue = bot_main.outbound.queue
+        submit = queue.submit
+
+        def recording_submit(chat_id, /, *args, **kwargs):
+            future = submit(chat_id, *args, **kwargs)
+            with self.lock:
+                self.sent[chat_id].append(future)
+            return future
+
+        queue.submit = recording_submit
+        self.dispatcher = ChatDispatcher(self.handle, workers)
+
+    def handle(self, update) -> None:
+        try:
+            self.main.bot.process_new_updates([update])
+        finally:
+            self.handled.pop(update.update_id).set()
+
+    def step(self, chat_id: int, language: str, text: str) -> [float, None]:
+        """
+        sends a text message or presses the first location button and waits until the bot has answered
+        :return: step latency in seconds, None if there is no button to press
+        """
+        update_id = next(self.update_ids)
+        user = {'id': chat_id, 'is_bot': False, 'first_name': 'user', 'language_code': language}
+        if text == 'press':
+            keyboard = next((message for message in reversed(self.telegram.messages[chat_id])
+                             if 'reply_markup' in message), None)
+            if keyboard is None:
+                return None
+            update = {'update_id': update_id, 'callback_query': {
+                'id': str(update_id), 'from': user, 'message': keyboard, 'chat_instance': str(chat_id),
+                'data': keyboard['reply_markup']['inline_keyboard'][0][0]['callback_data'],
+            }}
+        else:
+            update = {'update_id': update_id, 'message': {
+                'message_id': update_id, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'},
+                'from': user, 'text': text,
+            }}
+        handled = self.handled[update_id] = Event()
+        start = time.perf_counter()
+        self.dispatcher.submit(self.update_type.de_json(update))
+        handled.wait()
+        with self.lock:
+            futures = self.sent.pop(chat_id, [])
+        wait(futures)
+        return time.perf_counter() - start
+
+    def converse(self, chat_id: int, scenario: str, city: str) -> [tuple[float, float], None]:
+        """
+        runs one conversation
+        :return: latency of the last step, which makes the search, and of the whole conversation,
+        None if the bot has not offered locations, e.g. when the hotels api budget is exhausted
+        """
+        language = 'ru' if chat_id % 2 else 'en'
+        total = 0
+        latency = 0
+        for text in scenarios[scenario]:
+            latency = self.step(chat_id, language, text.format(city=city))
+            if latency is None:
+                return None
+            total += latency
+        return latency, total
+
+
+def load_bot(args, api: HotelsApiStub, telegram: TelegramStub):
+    os.environ.update({
+        'BOT_TOKEN': 'bench',
+        'HOTELS_API_URL': api.url,
+        'HOTELS_API_RATE': str(args.api_rate),
+        'HOTELS_API_BURST': str(args.api_rate),
+        'SEND_GLOBAL_RATE': str(args.send_global_rate),
+        'SEND_CHAT_RATE': str(args.send_chat_rate),
+        'SEND_CHAT_BURST': str(args.send_chat_burst),
+        'SEND_WORKERS': str(args.send_workers),
+    })
+    import bot_redis
+    db = bot_redis.redis_db = MemoryRedis()
+    bot_redis.redis_binary = db.binary()
+
+    from telebot import apihelper
+    apihelper.API_URL = telegram.url + 'bot{0}/{1}'
+
+    from loguru import logger
+    import main
+    from utils.session import CAS_STATE_SCRIPT
+
+    db.scripts[CAS_STATE_SCRIPT] = cas_state
+    if not args.logging:
+        logger.remove()
+    return main, db, bot_redis.redis_binary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20, help='conversations in progress at once')
+    parser.add_argument('--scenario', choices=('lowprice', 'bestdeal', 'mixed'), default='mixed')
+    parser.add_argument('--cities', type=int, default=10, help='number of distinct destinations')
+    parser.add_argument('--workers', type=int, default=8, help='dispatcher workers')
+    parser.add_argument('--api-latency', type=float, default=0.2, help='hotels api response time in seconds')
+    parser.add_argument('--telegram-latency', type=float, default=0.02, help='Bot API response time in seconds')
+    parser.add_argument('--api-rate', type=float, default=1000, help='hotels api budget, requests per second')
+    parser.add_argument('--pages', type=int, default=4, help='result pages of every search')
+    parser.add_argument('--fixtures', help='directory with recorded hotels api responses')
+    parser.add_argument('--send-global-rate', type=float, default=1000)
+    parser.add_argument('--send-chat-rate', type=float, default=100)
+    parser.add_argument('--send-chat-burst', type=float, default=100)
+    parser.add_argument('--send-workers', type=int, default=4)
+    parser.add_argument('--logging', action='store_true', help='keep the bot log sink')
+    args = parser.parse_args()
+
+    api = HotelsApiStub(args.api_latency, args.fixtures, args.pages)
+    telegram = TelegramStub(args.telegram_latency)
+    bot_main, db, binary_db = load_bot(args, api, telegram)
+    driver = Driver(bot_main, telegram, args.workers)
+
+    jobs = []
+    for number in range(args.conversations):
+        scenario = args.scenario
+        if scenario == 'mixed':
+            scenario = ('lowprice', 'bestdeal')[number % 2]
+        jobs.append((number + 1, scenario, CITIES[number % min(args.cities, len(CITIES))]))
+
+    latencies = defaultdict(list)
+    conversations = []
+    rejected = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        futures = {executor.submit(driver.converse, *job): job[1] for job in jobs}
+        for future, scenario in futures.items():
+            result = future.result()
+            if result is None:
+                rejected += 1
+                continue
+            search, total = result
+            latencies[scenario].append(search)
+            conversations.append(total)
+    elapsed = time.perf_counter() - start
+
+    searches = len(jobs)
+    updates = sum(len(scenarios[scenario]) for _, scenario, _ in jobs)
+    print(f'conversations: {searches}, updates: {updates}, concurrency: {args.concurrency}, '
+          f'elapsed: {elapsed:.2f} s, throughput: {searches / elapsed:.1f} searches/s, rejected: {rejected}')
+    for scenario, values in sorted(latencies.items()):
+        print(f'{scenario:9} search      {percentiles(values)}')
+    print(f'{"":9} conversation {percentiles(conversations)}')
+    redis_calls = db.calls + binary_db.calls
+    print(f'redis calls:       {redis_calls / searches:7.1f} per search, {redis_calls / updates:5.1f} per update')
+    for method, calls in sorted(api.calls.items()):
+        print(f'hotels api calls:  {calls / searches:7.2f} per search ({method})')
+    for method, calls in sorted(telegram.calls.items()):
+        print(f'telegram calls:    {calls / searches:7.2f} per search ({method})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares codecs of cached values: bytes stored per hotel page and per locations list, encode and decode time.
+The baseline is the json text of the page with a dict per hotel, as it was cached before. Reports how many pages
+fit in a redis memory budget, counting a rough per-key overhead of redis on top of the value.
+
+Usage: python -m benchmarks.bench_codecs [--pages 40] [--page-size 25] [--repeat 200] [--budget-mb 100]
+       [--fixture response.json ...]
+"""
+import argparse
+import io
+import json
+import time
+
+from benchmarks.fixtures import make_locations, make_page_bytes
+from botrequests.parsing import RECORD_FIELDS, parse_hotels_page
+from botrequests.serialization import Codec, msgpack
+
+# approximate memory of a redis string key with TTL and its member in the LRU index, besides the value
+KEY_OVERHEAD = 200
+
+
+class LegacyJson:
+    """
+    json text with a dict per hotel record
+    """
+
+    @staticmethod
+    def encode(value) -> bytes:
+        if 'fresh_until' in value:
+            page = value['value']
+            records = [dict(zip(RECORD_FIELDS, record)) for record in page['results']]
+            value = {**value, 'value': {**page, 'results': records}}
+        return json.dumps(value, ensure_ascii=False).encode()
+
+    @staticmethod
+    def decode(data: bytes):
+        return json.loads(data)
+
+
+def make_codecs() -> dict:
+    codecs = {'legacy json': LegacyJson, 'json': Codec('json')}
+    for level in (1, 6, 9):
+        codecs[f'json+zlib{level}'] = Codec('json', 'zlib', level)
+    if msgpack is not None:
+        codecs['msgpack'] = Codec('msgpack')
+        codecs['msgpack+zlib6'] = Codec('msgpack', 'zlib', 6)
+    return codecs
+
+
+def measure(codec, values: list, repeat: int) -> tuple[float, float, float]:
+    encoded = [codec.encode(value) for value in values]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            codec.encode(value)
+    encode_time = (time.perf_counter() - start) / repeat / len(values)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in encoded:
+            codec.decode(data)
+    decode_time = (time.perf_counter() - start) / repeat / len(values)
+    return sum(map(len, encoded)) / len(encoded), encode_time, decode_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--page-size', type=int, default=25)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--budget-mb', type=float, default=100, help='redis memory for cached hotel pages')
+    parser.add_argument('--fixture', nargs='*', default=(), help='recorded properties/list responses')
+    args = parser.parse_args()
+
+    if args.fixture:
+        bodies = []
+        for path in args.fixture:
+            with open(path, 'rb') as file:
+                bodies.append(file.read())
+    else:
+        bodies = [make_page_bytes(page, args.page_size, args.pages) for page in range(1, args.pages + 1)]
+    fresh_until = time.time()
+    pages = [{'fresh_until': fresh_until, 'value': parse_hotels_page(io.BytesIO(body))} for body in bodies]
+    locations = []
+    for number in range(args.pages):
+        response = make_locations(f'City {number}')
+        entities = response['suggestions'][0]['entities']
+        locations.append({entity['caption']: entity['destinationId'] for entity in entities})
+
+    budget = args.budget_mb * 1024 * 1024
+    print(f'hotel pages: {len(pages)}, {args.page_size} hotels per page')
+    for name, codec in make_codecs().items():
+        size, encode_time, decode_time = measure(codec, pages, args.repeat)
+        location_size = measure(codec, locations, 1)[0]
+        print(f'{name:14} page {size:7.0f} B  encode {encode_time * 1e6:7.1f} us  decode {decode_time * 1e6:7.1f} us  '
+              f'pages in {args.budget_mb:g} MB: {budget / (size + KEY_OVERHEAD):8.0f}  '
+              f'locations {location_size:5.0f} B')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Compares decoding a whole properties/list response and walking the tree with incremental parsing that keeps only the
+fields used by the bot. The body is fed in network-sized chunks, as it comes from the socket. Reports time per page,
+peak memory while parsing all pages of a /bestdeal search and memory retained by the parsed pages.
+
+Usage: python -m benchmarks.bench_parsing [--pages 4] [--page-size 25] [--repeat 200] [--fixture response.json ...]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.fixtures import make_page_bytes
+from botrequests.parsing import compact_hotel, parse_hotels_page
+
+CHUNK_SIZE = 16 * 1024
+
+
+class ChunkedBody:
+    """
+    file-like response body that returns prepared chunks
+    """
+
+    def __init__(self, chunks: list[bytes]) -> None:
+        self.chunks = iter(chunks)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return b''.join(self.chunks)
+        if size == 0:
+            return b''
+        return next(self.chunks, b'')
+
+
+def split(body: bytes) -> list[bytes]:
+    return [body[start:start + CHUNK_SIZE] for start in range(0, len(body), CHUNK_SIZE)]
+
+
+def parse_whole(chunks: list[bytes]) -> dict:
+    data = json.loads(ChunkedBody(chunks).read())
+    search_results = data.get('data', {}).get('body', {}).get('searchResults', {})
+    results = []
+    for hotel in search_results.get('results', []):
+        price = hotel.get('ratePlan', {}).get('price', {})
+        landmarks = hotel.get('landmarks') or [{}]
+        results.append(compact_hotel({
+            'id': hotel.get('id'),
+            'name': hotel.get('name'),
+            'star_rating': hotel.get('starRating'),
+            'exact_price': price.get('exactCurrent'),
+            'current_price': price.get('current'),
+            'distance': landmarks[0].get('distance'),
+            'address': (hotel.get('address') or {}).get('streetAddress'),
+        }))
+    # the raw response stays alive next to the structured copy, as it did in request_hotels
+    return {'raw': data, 'results': results}
+
+
+def parse_streaming(chunks: list[bytes]) -> dict:
+    return parse_hotels_page(ChunkedBody(chunks))
+
+
+def measure(parse, bodies: list[list[bytes]], repeat: int) -> tuple[float, int, int]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for chunks in bodies:
+            parse(chunks)
+    per_page = (time.perf_counter() - start) / repeat / len(bodies)
+
+    tracemalloc.start()
+    pages = [parse(chunks) for chunks in bodies]
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del pages
+    return per_page, peak, retained
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=4)
+    parser.add_argument('--page-size', type=int, default=25)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--fixture', nargs='*', default=(), help='recorded properties/list responses')
+    args = parser.parse_args()
+
+    if args.fixture:
+        bodies = []
+        for path in args.fixture:
+            with open(path, 'rb') as file:
+                bodies.append(file.read())
+    else:
+        bodies = [make_page_bytes(page, args.page_size, args.pages) for page in range(1, args.pages + 1)]
+    size = sum(map(len, bodies)) / len(bodies)
+    bodies = [split(body) for body in bodies]
+
+    whole = [page['results'] for page in map(parse_whole, bodies)]
+    streaming = [page['results'] for page in map(parse_streaming, bodies)]
+    assert whole == streaming, 'parsers disagree'
+
+    print(f'pages: {len(bodies)}, response size: {size / 1024:.1f} KiB per page')
+    for name, parse in (('json + walk', parse_whole), ('streaming', parse_streaming)):
+        per_page, peak, retained = measure(parse, bodies, args.repeat)
+        print(f'{name:12} {per_page * 1e6:9.1f} us/page  peak {peak / 1024:8.1f} KiB  '
+              f'retained {retained / 1024:8.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
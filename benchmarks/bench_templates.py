@@ -0,0 +1,89 @@
+"""
+Compares rendering of a page of hotel cards with per-field vocabulary lookups (each one reading the language from
+redis) and with precompiled per-language templates.
+
+Usage: python -m benchmarks.bench_templates [--hotels 25] [--repeat 2000] [--rtt 0.0002]
+"""
+import argparse
+import time
+
+from botrequests.parsing import Hotel
+from translations.templates import templates
+from translations.translations import vocabulary
+
+
+class DictRedis:
+    """
+    redis stand-in that keeps hashes in a dict and simulates a network round-trip for every call
+    """
+
+    def __init__(self, rtt: float = 0) -> None:
+        self.rtt = rtt
+        self.calls = 0
+        self.hashes = {}
+
+    def hget(self, name, key):
+        self.calls += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+        return self.hashes.get(name, {}).get(key)
+
+
+def make_hotels(quantity: int) -> list[Hotel]:
+    return [
+        Hotel(i, f'Hotel {i}', i % 6, 1000 + i * 17, f'{i / 10:.1f} km', f'Tverskaya street, {i}', 'en_US')
+        for i in range(quantity)
+    ]
+
+
+def render_by_lookups(hotels: list[Hotel], chat_id: int, db: DictRedis) -> list[str]:
+    def _(key):
+        return vocabulary[key][db.hget(chat_id, 'language')]
+
+    def rating(value):
+        return '⭐' * int(value) if value else _('no_information')
+
+    return [
+        f"{_('hotel')}: {hotel.name}\n"
+        f"{_('rating')}: {rating(hotel.star_rating)}\n"
+        f"{_('price')}: {hotel.price} {db.hget(chat_id, 'currency')}\n"
+        f"{_('distance')}: {hotel.distance_text}\n"
+        f"{_('address')}: {hotel.address}\n"
+        for hotel in hotels
+    ]
+
+
+def render_by_templates(hotels: list[Hotel], chat_id: int, db: DictRedis) -> list[str]:
+    message_templates = templates[db.hget(chat_id, 'language')]
+    currency = db.hget(chat_id, 'currency')
+    return [message_templates.render_hotel(hotel, currency) for hotel in hotels]
+
+
+def measure(render, hotels: list[Hotel], db: DictRedis, repeat: int) -> tuple[float, float]:
+    db.calls = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        render(hotels, 1, db)
+    elapsed = time.perf_counter() - start
+    return elapsed / repeat, db.calls / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hotels', type=int, default=25, help='hotels per page')
+    parser.add_argument('--repeat', type=int, default=2000, help='pages rendered by each method')
+    parser.add_argument('--rtt', type=float, default=0, help='simulated redis round-trip in seconds')
+    args = parser.parse_args()
+
+    hotels = make_hotels(args.hotels)
+    for lang in templates:
+        db = DictRedis(args.rtt)
+        db.hashes[1] = {'language': lang, 'currency': 'RUB'}
+        assert render_by_lookups(hotels, 1, db) == render_by_templates(hotels, 1, db)
+        for name, render in (('lookups', render_by_lookups), ('templates', render_by_templates)):
+            per_page, calls = measure(render, hotels, db, args.repeat)
+            print(f'{lang} {name:>9}: {per_page * 1e6:10.1f} us/page, {calls:5.0f} redis calls/page')
+
+
+if __name__ == '__main__':
+    main()
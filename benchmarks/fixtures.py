@@ -0,0 +1,117 @@
+"""
+Synthetic hotels api responses shaped like the recorded ones: every hotel carries the full set of fields returned by
+properties/list, most of which the bot never reads.
+"""
+import json
+import random
+import zlib
+
+
+def make_locations(query: str) -> dict:
+    """
+    makes locations/search response
+    :param query: location query
+    :return: decoded response
+    """
+    destination_id = 1000000 + zlib.crc32(query.casefold().encode()) % 1000000
+    return {
+        'term': query,
+        'moresuggestions': 10,
+        'autoSuggestInstance': None,
+        'trackingID': 'a1b2c3d4',
+        'misspellingfallback': False,
+        'suggestions': [
+            {'group': 'CITY_GROUP', 'entities': [
+                {'geoId': str(destination_id + number), 'destinationId': str(destination_id + number),
+                 'landmarkCityDestinationId': None, 'type': 'CITY', 'redirectPage': 'DEFAULT_PAGE',
+                 'latitude': 55.75, 'longitude': 37.61, 'searchDetail': None,
+                 'caption': f"<span class='highlighted'>{query}</span>{', Region' * number}, Country",
+                 'name': query}
+                for number in range(3)
+            ]},
+            {'group': 'HOTEL_GROUP', 'entities': []},
+            {'group': 'LANDMARK_GROUP', 'entities': []},
+        ],
+        'geocodeFallback': False,
+    }
+
+
+def make_hotel(number: int, unit: str = 'km') -> dict:
+    distance = f'{number * 0.1:.1f}'
+    if unit == 'км':
+        distance = distance.replace('.', ',')
+    return {
+        'id': 100000 + number,
+        'name': f'Hotel {number}',
+        'starRating': random.choice((0, 2, 3, 3.5, 4, 5)),
+        'urls': {},
+        'address': {
+            'streetAddress': f'Tverskaya street, {number}',
+            'extendedAddress': '',
+            'locality': 'Moscow',
+            'postalCode': f'{125000 + number}',
+            'region': 'Moscow',
+            'countryName': 'Russia',
+            'countryCode': 'RU',
+            'obfuscate': False,
+        },
+        'guestReviews': {'unformattedRating': 8.6, 'rating': '8.6', 'total': 1234 + number, 'scale': 10,
+                         'badge': 'fabulous', 'badgeText': 'Fabulous'},
+        'landmarks': [
+            {'label': 'City center', 'distance': f'{distance} {unit}'},
+            {'label': 'Red Square', 'distance': f'{distance} {unit}'},
+        ],
+        'ratePlan': {
+            'price': {'current': f'${100 + number:,}', 'exactCurrent': float(100 + number),
+                      'old': f'${150 + number:,}', 'fullyBundledPricePerStay': 'total $1,024'},
+            'features': {'freeCancellation': True, 'paymentPreference': False, 'noCCRequired': False},
+        },
+        'neighbourhood': 'Tverskoy',
+        'deals': {'specialDeal': {'dealText': 'Save 10%'}, 'priceReasoning': 'DRR-441'},
+        'messaging': {'scarcity': 'We have 2 left'},
+        'badging': {'hotelBadge': {'type': 'vipBadge', 'label': 'VIP Access'}},
+        'pimmsAttributes': 'DoubleStamps|D13|TESCO',
+        'coordinate': {'lat': 55.75 + number / 1000, 'lon': 37.61 + number / 1000},
+        'roomsLeft': 2,
+        'providerType': 'LOCAL',
+        'supplierHotelId': 200000 + number,
+        'vrBadge': 'Vacation Rentals',
+        'isAlternative': False,
+        'optimizedThumbUrls': {'srpDesktop': f'https://exp.cdn-hotels.com/hotels/{number}/{number}_z.jpg'},
+    }
+
+
+def make_page(page: int = 1, page_size: int = 25, pages: int = 4, unit: str = 'km') -> dict:
+    """
+    makes properties/list response
+    :param page: page number
+    :param page_size: number of hotels on the page
+    :param pages: total number of pages
+    :param unit: distance unit
+    :return: decoded response
+    """
+    first = (page - 1) * page_size
+    return {
+        'result': 'OK',
+        'data': {'body': {
+            'header': 'Moscow, Russia',
+            'query': {'destination': {'id': '1153093', 'value': 'Moscow', 'resolvedLocation': 'CITY:1153093:UNKNOWN'}},
+            'searchResults': {
+                'totalCount': page_size * pages,
+                'results': [make_hotel(number, unit) for number in range(first, first + page_size)],
+                'pagination': {'currentPage': page, 'pageGroup': 'EXPEDIA_IN_POLYGON',
+                               'nextPageNumber': page + 1 if page < pages else None},
+            },
+            'sortResults': {'options': [{'label': 'Featured', 'itemMeta': 'popular'}] * 8},
+            'filters': {'name': {}, 'starRating': {'items': [{'value': str(i)} for i in range(1, 6)]}},
+        }},
+        'common': {'pointOfSale': {'numberSeparators': ',.', 'brandName': 'Hotels.com'}},
+    }
+
+
+def make_locations_bytes(query: str) -> bytes:
+    return json.dumps(make_locations(query)).encode()
+
+
+def make_page_bytes(page: int = 1, page_size: int = 25, pages: int = 4, unit: str = 'km') -> bytes:
+    return json.dumps(make_page(page, page_size, pages, unit)).encode()
@@ -0,0 +1,229 @@
+"""
+In-memory stand-in for the part of the redis client used by the bot. Every command and every pipeline counts as one
+round-trip in `calls`. Lua scripts are not interpreted: the python implementation of a script is registered in
+`scripts` by its text.
+"""
+import fnmatch
+import time
+from threading import RLock
+
+
+class MemoryPipeline:
+    def __init__(self, db: 'MemoryRedis') -> None:
+        self.db = db
+        self.commands = []
+
+    def __getattr__(self, name: str):
+        def command(*args, **kwargs):
+            self.commands.append((getattr(MemoryRedis, name), args, kwargs))
+            return self
+        return command
+
+    def execute(self) -> list:
+        with self.db.lock:
+            self.db.calls += 1
+            commands, self.commands = self.commands, []
+            return [func(self.db, *args, **kwargs) for func, args, kwargs in commands]
+
+
+class MemoryScript:
+    def __init__(self, db: 'MemoryRedis', script: str) -> None:
+        self.db = db
+        self.script = script
+
+    def __call__(self, keys=(), args=(), client=None):
+        with self.db.lock:
+            self.db.calls += 1
+            return self.db.scripts[self.script](self.db, list(keys), list(args))
+
+
+class MemoryRedis:
+    """
+    Thread-safe dict based redis with strings, hashes, sorted sets and key expiration
+    """
+
+    def __init__(self, decode_responses: bool = True) -> None:
+        self.data = {}
+        self.expires = {}
+        self.scripts = {}
+        self.calls = 0
+        self.lock = RLock()
+        self.decode_responses = decode_responses
+
+    def __getattribute__(self, name: str):
+        attribute = object.__getattribute__(self, name)
+        if name.startswith('_') or not callable(attribute) or name in ('pipeline', 'register_script', 'binary'):
+            return attribute
+
+        def command(*args, **kwargs):
+            with self.lock:
+                self.calls += 1
+                return attribute(*args, **kwargs)
+        return command
+
+    def binary(self) -> 'MemoryRedis':
+        """
+        returns a client of the same data that returns sorted set members as bytes, like a redis client without
+        decode_responses
+        """
+        client = MemoryRedis(decode_responses=False)
+        client.data, client.expires, client.scripts, client.lock = self.data, self.expires, self.scripts, self.lock
+        return client
+
+    def _members(self, items: list) -> list:
+        if self.decode_responses:
+            return items
+        return [(member.encode(), score) for member, score in items]
+
+    def pipeline(self, transaction: bool = True) -> MemoryPipeline:
+        return MemoryPipeline(self)
+
+    def register_script(self, script: str) -> MemoryScript:
+        return MemoryScript(self, script)
+
+    def _key(self, name) -> str:
+        name = str(name)
+        if name in self.expires and self.expires[name] <= time.time():
+            del self.data[name]
+            del self.expires[name]
+        return name
+
+    def _container(self, name) -> dict:
+        return self.data.setdefault(self._key(name), {})
+
+    def ping(self) -> bool:
+        return True
+
+    def get(self, name):
+        return self.data.get(self._key(name))
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        name = self._key(name)
+        if nx and name in self.data:
+            return None
+        self.data[name] = value if isinstance(value, bytes) else str(value)
+        self.expires.pop(name, None)
+        if ex:
+            self.expires[name] = time.time() + ex
+        if px:
+            self.expires[name] = time.time() + px / 1000
+        return True
+
+    def setex(self, name, time_to_live, value):
+        return MemoryRedis.set(self, name, value, ex=time_to_live)
+
+    def incr(self, name, amount=1) -> int:
+        name = self._key(name)
+        self.data[name] = str(int(self.data.get(name, 0)) + amount)
+        return int(self.data[name])
+
+    def pttl(self, name) -> int:
+        name = self._key(name)
+        if name not in self.data:
+            return -2
+        if name not in self.expires:
+            return -1
+        return int((self.expires[name] - time.time()) * 1000)
+
+    def ttl(self, name) -> int:
+        pttl = MemoryRedis.pttl(self, name)
+        return pttl if pttl < 0 else pttl // 1000
+
+    def expire(self, name, time_to_live) -> bool:
+        name = self._key(name)
+        if name not in self.data:
+            return False
+        self.expires[name] = time.time() + time_to_live
+        return True
+
+    def delete(self, *names) -> int:
+        deleted = 0
+        for name in names:
+            name = self._key(name)
+            deleted += self.data.pop(name, None) is not None
+            self.expires.pop(name, None)
+        return deleted
+
+    def exists(self, *names) -> int:
+        return sum(self._key(name) in self.data for name in names)
+
+    def type(self, name) -> str:
+        value = self.data.get(self._key(name))
+        if value is None:
+            return 'none'
+        if not isinstance(value, dict):
+            return 'string'
+        return 'zset' if value and all(isinstance(score, (int, float)) for score in value.values()) else 'hash'
+
+    def hget(self, name, key):
+        return self.data.get(self._key(name), {}).get(key)
+
+    def hgetall(self, name) -> dict:
+        return dict(self.data.get(self._key(name), {}))
+
+    def hset(self, name, key=None, value=None, mapping=None) -> int:
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        hash_ = self._container(name)
+        added = len(items.keys() - hash_.keys())
+        hash_.update({field: item if isinstance(item, bytes) else str(item) for field, item in items.items()})
+        return added
+
+    def hincrby(self, name, key, amount=1) -> int:
+        hash_ = self._container(name)
+        hash_[key] = str(int(hash_.get(key, 0)) + amount)
+        return int(hash_[key])
+
+    def hdel(self, name, *keys) -> int:
+        hash_ = self._container(name)
+        return sum(hash_.pop(key, None) is not None for key in keys)
+
+    def zadd(self, name, mapping, nx=False, xx=False) -> int:
+        zset = self._container(name)
+        added = 0
+        for member, score in mapping.items():
+            if (nx and member in zset) or (xx and member not in zset):
+                continue
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def zincrby(self, name, amount, member) -> float:
+        zset = self._container(name)
+        zset[member] = zset.get(member, 0) + amount
+        return zset[member]
+
+    def zcard(self, name) -> int:
+        return len(self.data.get(self._key(name), {}))
+
+    def zscore(self, name, member):
+        return self.data.get(self._key(name), {}).get(member)
+
+    def zrange(self, name, start, end, desc=False, withscores=False) -> list:
+        items = sorted(self.data.get(self._key(name), {}).items(), key=lambda item: item[1], reverse=desc)
+        items = self._members(items[start:None if end == -1 else end + 1])
+        return items if withscores else [member for member, _ in items]
+
+    def zrevrange(self, name, start, end, withscores=False) -> list:
+        return MemoryRedis.zrange(self, name, start, end, desc=True, withscores=withscores)
+
+    def zpopmin(self, name, count=1) -> list:
+        zset = self._container(name)
+        items = sorted(zset.items(), key=lambda item: item[1])[:count]
+        for member, _ in items:
+            del zset[member]
+        return self._members(items)
+
+    def zremrangebyscore(self, name, min_score, max_score) -> int:
+        zset = self._container(name)
+        removed = [member for member, score in zset.items() if float(min_score) <= score <= float(max_score)]
+        for member in removed:
+            del zset[member]
+        return len(removed)
+
+    def scan_iter(self, match='*', count=None):
+        return iter([name for name in list(self.data) if fnmatch.fnmatch(name, match) and self._key(name) in self.data])
+
+    def memory_usage(self, name) -> int:
+        return len(repr(self.data.get(self._key(name)))) + 50
@@ -0,0 +1,140 @@
+"""
+Local http servers standing in for the hotels api and the Telegram Bot API. Both count the calls per method and can
+add a fixed latency to every response.
+"""
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qsl, urlsplit
+
+from benchmarks.fixtures import make_locations_bytes, make_page_bytes
+
+
+class StubServer:
+    """
+    Threading http server on a free local port, answers with the result of respond(method, path, params)
+    """
+
+    def __init__(self, latency: float = 0) -> None:
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def handle_request(self) -> None:
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    params.update(parse_qsl(self.rfile.read(length).decode()))
+                method = stub.method(url.path)
+                with stub.lock:
+                    stub.calls[method] += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, body = stub.respond(method, url.path, params)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f'http://{host}:{port}/'
+
+    def method(self, path: str) -> str:
+        return path.strip('/')
+
+    def respond(self, method: str, path: str, params: dict) -> tuple[int, bytes]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HotelsApiStub(StubServer):
+    """
+    Replays recorded hotels api responses from a directory (locations_search.json, properties_list_<page>.json),
+    synthetic responses are generated for the missing ones
+    """
+
+    def __init__(self, latency: float = 0, fixtures: str = None, pages: int = 4) -> None:
+        self.pages = pages
+        self.recorded = {}
+        if fixtures:
+            for name in os.listdir(fixtures):
+                with open(os.path.join(fixtures, name), 'rb') as file:
+                    self.recorded[name] = file.read()
+        self.generated = {}
+        super().__init__(latency)
+
+    def respond(self, method: str, path: str, params: dict) -> tuple[int, bytes]:
+        if method == 'locations/search':
+            name = 'locations_search.json'
+            make = lambda: make_locations_bytes(params.get('query', ''))
+        elif method == 'properties/list':
+            page = int(params.get('pageNumber', 1))
+            name = f'properties_list_{page}.json'
+            unit = 'км' if params.get('locale') == 'ru_RU' else 'miles'
+            make = lambda: make_page_bytes(page, int(params.get('pageSize', 25)), self.pages, unit)
+        else:
+            return 404, b'{"message": "Endpoint does not exist"}'
+        if name in self.recorded:
+            return 200, self.recorded[name]
+        key = (name, params.get('query'), params.get('locale'))
+        if key not in self.generated:
+            self.generated[key] = make()
+        return 200, self.generated[key]
+
+
+class TelegramStub(StubServer):
+    """
+    Accepts Bot API requests and keeps the messages sent to every chat
+    """
+
+    def __init__(self, latency: float = 0) -> None:
+        self.messages = defaultdict(list)
+        self.message_ids = Counter()
+        super().__init__(latency)
+
+    def method(self, path: str) -> str:
+        return path.rstrip('/').rsplit('/', 1)[-1]
+
+    def respond(self, method: str, path: str, params: dict) -> tuple[int, bytes]:
+        result = True
+        if method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            with self.lock:
+                self.message_ids[chat_id] += 1
+                result = {
+                    'message_id': self.message_ids[chat_id],
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': 1, 'is_bot': True, 'first_name': 'bot'},
+                    'text': params.get('text', ''),
+                }
+                if params.get('reply_markup'):
+                    result['reply_markup'] = json.loads(params['reply_markup'])
+                self.messages[chat_id].append(result)
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bench_bot'}
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
@@ -1,9 +1,226 @@
+import os
+
 import redis
+from dotenv import load_dotenv
+from loguru import logger
+from redis.client import Pipeline
+from redis.sentinel import Sentinel, SentinelConnectionPool
+
+from utils.metrics import redis_calls
+
+try:
+    from rediscluster import RedisCluster
+except ImportError:
+    RedisCluster = None
+
+load_dotenv()
+REDIS_MODE = os.getenv('REDIS_MODE', 'single')
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 1))
+REDIS_PASSWORD = os.getenv('REDIS_PASSWORD')
+REDIS_SENTINELS = os.getenv('REDIS_SENTINELS', '')
+REDIS_SENTINEL_MASTER = os.getenv('REDIS_SENTINEL_MASTER', 'mymaster')
+REDIS_CLUSTER_NODES = os.getenv('REDIS_CLUSTER_NODES', '')
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 64))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 2))
+REDIS_KEEPALIVE = os.getenv('REDIS_KEEPALIVE', '1') == '1'
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
+# in cluster mode a script may only touch keys of one hash slot
+is_cluster = REDIS_MODE == 'cluster'
+
+# version of the key schema, kept in redis to run migrations once
+SCHEMA_KEY = 'schema:version'
+
+connection_options = {
+    'password': REDIS_PASSWORD,
+    'socket_timeout': REDIS_SOCKET_TIMEOUT,
+    'socket_connect_timeout': REDIS_CONNECT_TIMEOUT,
+    'socket_keepalive': REDIS_KEEPALIVE,
+    'retry_on_timeout': True,
+}
+
+
+def user_key(chat_id) -> str:
+    """
+    returns the key of the user hash, the chat id in braces is the cluster hash tag, so all keys of the chat are
+    in one hash slot
+    :param chat_id: chat id
+    :return: redis key
+    """
+    return f'user:{{{chat_id}}}'
+
+
+def wizard_key(chat_id) -> str:
+    """
+    returns the key of the search wizard hash of the chat, it is in the hash slot of the user key
+    :param chat_id: chat id
+    :return: redis key
+    """
+    return f'wizard:{{{chat_id}}}'
+
+
+class CountingPipeline(Pipeline):
+    def execute(self, raise_on_error=True):
+        redis_calls.inc()
+        return super().execute(raise_on_error)
+
+
+class CountingRedis(redis.StrictRedis):
+    """
+    Redis client that counts round-trips to the server
+    """
+
+    def execute_command(self, *args, **options):
+        redis_calls.inc()
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+if RedisCluster is not None:
+    class CountingCluster(RedisCluster):
+        """
+        Redis cluster client that counts round-trips, a pipeline counts as one call
+        """
+
+        def execute_command(self, *args, **kwargs):
+            redis_calls.inc()
+            return super().execute_command(*args, **kwargs)
+
+        def pipeline(self, transaction=None, shard_hint=None, read_from_replicas=False):
+            pipe = super().pipeline(transaction, shard_hint, read_from_replicas)
+            execute = pipe.execute
+
+            def counting_execute(raise_on_error=True):
+                redis_calls.inc()
+                return execute(raise_on_error)
+
+            pipe.execute = counting_execute
+            return pipe
+
+
+class BlockingSentinelConnectionPool(SentinelConnectionPool, redis.BlockingConnectionPool):
+    """
+    Sentinel pool which waits up to timeout for a free connection like the single node pool, instead of raising
+    "Too many connections" at once
+    """
+
+    def disconnect(self, inuse_connections: bool = True) -> None:
+        # called with inuse_connections=False when the master has changed
+        if inuse_connections:
+            return super().disconnect()
+        self._checkpid()
+        for connection in list(self.pool.queue):
+            if connection is not None:
+                connection.disconnect()
+
+
+def parse_nodes(nodes: str) -> list[tuple[str, int]]:
+    """
+    parses a comma separated list of nodes
+    :param nodes: string like "10.0.0.1:26379,10.0.0.2:26379"
+    :return: list of (host, port)
+    """
+    result = []
+    for node in filter(None, (node.strip() for node in nodes.split(','))):
+        host, _, port = node.rpartition(':')
+        result.append((host, int(port)))
+    return result
+
+
+def make_client(decode_responses: bool = True):
+    """
+    makes redis client for REDIS_MODE: single, sentinel or cluster
+    :param decode_responses: return str instead of bytes
+    :return: redis client
+    """
+    if REDIS_MODE == 'sentinel':
+        sentinel = Sentinel(
+            parse_nodes(REDIS_SENTINELS),
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        )
+        return sentinel.master_for(
+            REDIS_SENTINEL_MASTER,
+            redis_class=CountingRedis,
+            connection_pool_class=BlockingSentinelConnectionPool,
+            db=REDIS_DB,
+            decode_responses=decode_responses,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+            **connection_options,
+        )
+    if is_cluster:
+        if RedisCluster is None:
+            raise RuntimeError('REDIS_MODE=cluster requires redis-py-cluster, pip install redis-py-cluster')
+        return CountingCluster(
+            startup_nodes=[{'host': host, 'port': port} for host, port in parse_nodes(REDIS_CLUSTER_NODES)],
+            decode_responses=decode_responses,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            skip_full_coverage_check=True,
+            **connection_options,
+        )
+    pool = redis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_DB,
+        decode_responses=decode_responses,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        **connection_options,
+    )
+    return CountingRedis(connection_pool=pool)
+
+
+def move_user_hashes(client) -> int:
+    """
+    moves user hashes stored under bare chat ids to user:{chat_id} keys
+    :param client: redis client with decoded responses
+    :return: number of moved users
+    """
+    moved = 0
+    for key in client.scan_iter(count=1000):
+        if not key.lstrip('-').isdigit() or client.type(key) != 'hash':
+            continue
+        data = client.hgetall(key)
+        # a hash already written under the new key by an updated process is newer
+        if data and not client.exists(user_key(key)):
+            client.hset(user_key(key), mapping=data)
+            moved += 1
+        client.delete(key)
+    return moved
+
+
+# migrations of the key schema by the version they migrate to, modules owning the keys add their own
+migrations = {2: move_user_hashes}
+
+
+def migrate_keys(client) -> int:
+    """
+    runs the migrations newer than the schema version kept in redis, in the order of versions
+    :param client: redis client with decoded responses
+    :return: number of migrated keys
+    """
+    version = int(client.get(SCHEMA_KEY) or 1)
+    migrated = 0
+    for target in sorted(migrations):
+        if target <= version:
+            continue
+        count = migrations[target](client)
+        client.set(SCHEMA_KEY, target)
+        logger.info(f'Redis keys migrated to schema {target}: {count} keys')
+        migrated += count
+    return migrated
+
+
+redis_db = make_client()
 
-redis_db = redis.StrictRedis(
-    host='localhost',
-    port=6379,
-    db=1,
-    charset='utf-8',
-    decode_responses=True
-)
\ No newline at end of file
+# connection for binary values, e.g. compressed cache entries
+redis_binary = make_client(decode_responses=False)
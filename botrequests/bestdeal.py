@@ -0,0 +1,72 @@
+import heapq
+from itertools import count
+
+from botrequests.parsing import Hotel
+from utils.metrics import timed
+
+
+class BestDealSelector:
+    """
+    Keeps the cheapest hotels within the distance from the pages fed to it in a heap bounded by the number of hotels
+    requested. Hotels of equal price keep the order in which they arrived. Other hotels within the distance are kept
+    aside for the next pages of results
+    """
+
+    def __init__(self, distance: float, limit: int, price_floor: float = 0) -> None:
+        self.distance = distance
+        self.limit = limit
+        self.price_floor = price_floor
+        self.seen = set()
+        self.total = 0
+        self.rest = []
+        # a page ended farther than the distance, the next pages have no hotels within it
+        self.beyond_distance = False
+        # max-heap on (price, arrival): the root is the most expensive of the kept hotels, the latest among equal
+        self._heap = []
+        self._arrival = count()
+
+    @timed('select_best_hotels')
+    def add(self, hotels: list[Hotel]) -> None:
+        """
+        feeds hotels of the next page
+        :param hotels: hotels of the page
+        :return: None
+        """
+        for hotel in hotels:
+            if hotel in self.seen:
+                continue
+            self.seen.add(hotel)
+            self.total += 1
+            if hotel.distance > self.distance:
+                continue
+            item = (-hotel.price, -next(self._arrival), hotel)
+            if len(self._heap) < self.limit:
+                heapq.heappush(self._heap, item)
+            elif hotel.price < -self._heap[0][0]:
+                self.rest.append(heapq.heapreplace(self._heap, item)[2])
+            else:
+                self.rest.append(hotel)
+        if hotels and hotels[-1].distance > self.distance:
+            self.beyond_distance = True
+
+    @property
+    def is_complete(self) -> bool:
+        """
+        the api returns only hotels not cheaper than the price floor, so once the requested number of hotels at the
+        floor price is found, the next pages cannot improve the selection
+        """
+        return len(self._heap) >= self.limit and -self._heap[0][0] <= self.price_floor
+
+    def best(self) -> list[Hotel]:
+        """
+        returns the selected hotels
+        :return: hotels sorted by price in increasing order
+        """
+        return [hotel for _, _, hotel in sorted(self._heap, reverse=True)]
+
+    def ranked(self) -> list[Hotel]:
+        """
+        returns the selected hotels followed by the other hotels within the distance
+        :return: hotels, both parts sorted by price in increasing order
+        """
+        return self.best() + sorted(self.rest, key=lambda hotel: hotel.price)
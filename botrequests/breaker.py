@@ -0,0 +1,109 @@
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+import requests
+from loguru import logger
+from urllib3.exceptions import HTTPError
+
+from utils.metrics import api_circuit_events, api_circuit_state
+
+BREAKER_FAILURES = int(os.getenv('HOTELS_API_BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.getenv('HOTELS_API_BREAKER_RESET', 30))
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+states = (CLOSED, HALF_OPEN, OPEN)
+
+# errors that mean the upstream is unavailable, a response body cut by a timeout is raised by urllib3 directly
+FAILURES = (requests.exceptions.RequestException, HTTPError)
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops calling an endpoint after a number of consecutive failures, so that users get an answer at once instead
+    of waiting for the timeout. After the reset timeout a single probe call is let through: its success closes the
+    circuit, its failure opens it again
+    """
+
+    def __init__(self, name: str, failures: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failed = 0
+        self._opened_at = 0
+        self._probing = False
+        self._lock = Lock()
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f'Circuit of {self.name} is {state}')
+            self.state = state
+            api_circuit_state.labels(self.name).set(states.index(state))
+
+    def allow(self) -> bool:
+        """
+        checks whether a call may be made now, in the half-open state only one probe call at a time is allowed
+        :return: True if the call is allowed
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._probing):
+                self._probing = self.state == HALF_OPEN
+                return True
+            api_circuit_events.labels(self.name, 'short_circuited').inc()
+            return False
+
+    def record(self, success: bool) -> None:
+        """
+        records the result of an allowed call
+        :param success: False if the upstream failed
+        :return: None
+        """
+        with self._lock:
+            self._probing = False
+            if success:
+                self._failed = 0
+                self._set_state(CLOSED)
+                return
+            self._failed += 1
+            api_circuit_events.labels(self.name, 'failures').inc()
+            if self.state == HALF_OPEN or self._failed >= self.failures:
+                self._opened_at = time.monotonic()
+                if self.state != OPEN:
+                    api_circuit_events.labels(self.name, 'opened').inc()
+                self._set_state(OPEN)
+
+    def release(self) -> None:
+        """
+        gives back the probe slot of a call that has not reached the upstream
+        :return: None
+        """
+        with self._lock:
+            self._probing = False
+
+    @contextmanager
+    def guard(self):
+        """
+        wraps a call to the upstream: raises CircuitOpen if the call is not allowed, records failures on FAILURES
+        and success otherwise. Other exceptions, e.g. a refused quota, are not counted
+        """
+        if not self.allow():
+            raise CircuitOpen(self.name)
+        try:
+            yield
+        except FAILURES:
+            self.record(False)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(True)
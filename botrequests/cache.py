@@ -0,0 +1,144 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from loguru import logger
+
+from bot_redis import redis_binary
+from botrequests.serialization import Codec, cache_codec
+from botrequests.singleflight import SingleFlight
+from utils.metrics import cache_events
+
+refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cache-refresh')
+
+
+class Cache:
+    """
+    Two-level cache: an in-process LRU in front of redis keys with TTL. Redis keeps a sorted set of cached keys
+    scored by last access time, which is used to evict least recently used keys above max_size. Values are stored
+    in redis encoded by the codec
+    """
+
+    def __init__(self, name: str, ttl: int, max_size: int, local_size: int = 1000, codec: Codec = cache_codec) -> None:
+        self.name = name
+        self.codec = codec
+        self.ttl = ttl
+        self.max_size = max_size
+        self.local_size = local_size
+        self.flight = SingleFlight(name)
+        self._local = OrderedDict()
+        self._lock = Lock()
+
+    def _redis_key(self, key: str) -> str:
+        return f'cache:{self.name}:{key}'
+
+    def _index_key(self) -> str:
+        return f'cache:{self.name}:index'
+
+    def _count(self, event: str) -> None:
+        cache_events.labels(self.name, event).inc()
+
+    def _remember(self, key: str, value, expires_at: float) -> None:
+        with self._lock:
+            self._local[key] = (expires_at, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get(self, key: str):
+        """
+        returns cached value or None
+        :param key: cache key
+        :return: cached value
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry and entry[0] > now:
+                self._local.move_to_end(key)
+                self._count('local_hits')
+                return entry[1]
+            if entry:
+                del self._local[key]
+
+        pipe = redis_binary.pipeline(transaction=False)
+        pipe.get(self._redis_key(key))
+        pipe.pttl(self._redis_key(key))
+        pipe.zadd(self._index_key(), {key: now}, xx=True)
+        raw, pttl, _ = pipe.execute()
+        if raw is None:
+            self._count('misses')
+            return None
+
+        try:
+            value = self.codec.decode(raw)
+        except ValueError as e:
+            # written by an older version of the bot, it is replaced on the next fetch
+            logger.warning(f'Cached value "{key}" is not decoded: {e}')
+            self._count('misses')
+            return None
+        self._remember(key, value, now + max(pttl, 0) / 1000)
+        self._count('hits')
+        return value
+
+    def set(self, key: str, value, ttl: int = None) -> None:
+        """
+        stores value in redis and in the local cache, evicts least recently used keys above max_size
+        :param key: cache key
+        :param value: json serializable value
+        :param ttl: time to live in seconds, cache ttl by default
+        :return: None
+        """
+        ttl = ttl or self.ttl
+        now = time.time()
+        pipe = redis_binary.pipeline(transaction=False)
+        pipe.set(self._redis_key(key), self.codec.encode(value), ex=ttl)
+        pipe.zadd(self._index_key(), {key: now})
+        pipe.zremrangebyscore(self._index_key(), '-inf', now - self.ttl)
+        pipe.zcard(self._index_key())
+        size = pipe.execute()[-1]
+        self._remember(key, value, now + ttl)
+
+        if size > self.max_size:
+            evicted = [member.decode() for member, _ in redis_binary.zpopmin(self._index_key(), size - self.max_size)]
+            redis_binary.delete(*[self._redis_key(member) for member in evicted])
+            with self._lock:
+                for member in evicted:
+                    self._local.pop(member, None)
+
+    def get_or_fetch(self, key: str, fetch, ttl: int = None, fresh_for: int = None, is_valid=bool, refresh=None):
+        """
+        returns cached value or calls fetch on a miss. Values older than fresh_for seconds are returned stale and
+        refreshed in background. Concurrent calls for the same key share one fetch call
+        :param key: cache key
+        :param fetch: function without arguments that returns the value, None to return None on a miss
+        :param ttl: time to live in seconds, cache ttl by default
+        :param fresh_for: seconds during which the value is served without refreshing, ttl by default
+        :param is_valid: predicate, values failing it are returned but not cached
+        :param refresh: function used instead of fetch to refresh stale values in background
+        :return: value
+        """
+        entry = self.get(key)
+        if entry is not None:
+            if entry['fresh_until'] < time.time():
+                self._count('stale_hits')
+                self._refresh(key, refresh or fetch, ttl, fresh_for, is_valid)
+            return entry['value']
+        if fetch is None:
+            return None
+        return self._fetch(key, fetch, ttl, fresh_for, is_valid)
+
+    def _fetch(self, key: str, fetch, ttl: int, fresh_for: int, is_valid):
+        return self.flight.do(key, self._fetch_and_store, key, fetch, ttl, fresh_for, is_valid)
+
+    def _fetch_and_store(self, key: str, fetch, ttl: int, fresh_for: int, is_valid):
+        value = fetch()
+        if is_valid(value):
+            fresh_until = time.time() + (fresh_for or ttl or self.ttl)
+            self.set(key, {'fresh_until': fresh_until, 'value': value}, ttl)
+        return value
+
+    def _refresh(self, key: str, fetch, ttl: int, fresh_for: int, is_valid) -> None:
+        if not self.flight.in_flight(key):
+            refresh_executor.submit(self._fetch, key, fetch, ttl, fresh_for, is_valid)
@@ -0,0 +1,147 @@
+import os
+import time
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from botrequests.breaker import BREAKER_FAILURES, BREAKER_RESET, CircuitBreaker
+from botrequests.hedging import LatencyWindow, hedged
+from botrequests.quota import EXTRA, PRIMARY, QuotaExceeded, quota_budget
+from botrequests.singleflight import upstream
+from utils.metrics import api_requests
+
+load_dotenv()
+
+X_RAPIDAPI_KEY = os.getenv('RAPID_API_KEY')
+API_HOST = 'hotels4.p.rapidapi.com'
+API_URL = os.getenv('HOTELS_API_URL', f'https://{API_HOST}/')
+
+POOL_SIZE = int(os.getenv('HOTELS_API_POOL_SIZE', 10))
+RETRIES = int(os.getenv('HOTELS_API_RETRIES', 3))
+BACKOFF_FACTOR = float(os.getenv('HOTELS_API_BACKOFF', 0.5))
+LOCATIONS_HEDGE = os.getenv('LOCATIONS_HEDGE', '1') == '1'
+LOCATIONS_HEDGE_DELAY = float(os.getenv('LOCATIONS_HEDGE_DELAY', 1))
+
+# (connect, read) timeouts in seconds for every hotels api endpoint
+timeouts = {
+    'locations/search': (3.05, 10),
+    'properties/list': (3.05, 20),
+}
+breakers = {endpoint: CircuitBreaker(endpoint, BREAKER_FAILURES, BREAKER_RESET) for endpoint in timeouts}
+latencies = {endpoint: LatencyWindow() for endpoint in timeouts}
+# endpoints whose slow requests are repeated after the 95th percentile of their latency
+hedged_endpoints = {'locations/search'} if LOCATIONS_HEDGE else set()
+
+
+class BudgetedRetry(Retry):
+    """
+    Retry which takes every resend from the quota budget as an extra request, so resends are counted against the
+    quota and are not sent when the budget is tight
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if not quota_budget.acquire(EXTRA):
+            raise MaxRetryError(_pool, url, error or ResponseError('hotels api budget is tight'))
+        path = urlsplit(url).path
+        api_requests.labels(next((endpoint for endpoint in timeouts if path.endswith(endpoint)), path)).inc()
+        return retry
+
+
+def make_session() -> requests.Session:
+    """
+    creates http session with keep-alive connection pool, compression and retries with backoff on 5xx and connection
+    errors. 429 is not retried, the quota budget keeps to the rate limit
+    :return: requests Session
+    """
+    retry = BudgetedRetry(
+        total=RETRIES,
+        read=0,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'x-rapidapi-key': X_RAPIDAPI_KEY,
+        'x-rapidapi-host': API_HOST,
+        'Accept-Encoding': 'gzip, deflate',
+    })
+    return session
+
+
+session = make_session()
+
+
+def api_get(endpoint: str, params: dict, parse=None, priority: int = PRIMARY):
+    """
+    sends GET request to the hotels api through the shared session, concurrent identical requests share one call.
+    Every call is taken from the quota budget and goes through the circuit breaker of the endpoint
+    :param endpoint: api endpoint, for example "locations/search"
+    :param params: query parameters
+    :param parse: function that reads the response body from a file-like object, by default the whole body is
+    decoded as json
+    :param priority: PRIMARY, EXTRA or BACKGROUND
+    :return: decoded json response or the result of parse
+    :raise QuotaExceeded: if the budget has no room for the request
+    :raise CircuitOpen: if the endpoint is failing and is not called now
+    """
+    key = endpoint + '?' + urlencode(sorted(params.items()))
+    if parse is not None:
+        return upstream.do(f'{parse.__name__}:{key}', _stream, endpoint, params, parse, priority)
+    if endpoint in hedged_endpoints:
+        return upstream.do(key, _get_hedged, endpoint, params, priority)
+    return upstream.do(key, _get, endpoint, params, priority)
+
+
+def _acquire(endpoint: str, priority: int) -> None:
+    if not quota_budget.acquire(priority):
+        raise QuotaExceeded(endpoint)
+    api_requests.labels(endpoint).inc()
+
+
+def _check_status(response: requests.Response) -> None:
+    quota_budget.update(response.headers)
+    # client errors come with a json message which is handled by the callers
+    if response.status_code >= 500:
+        response.raise_for_status()
+
+
+def _get(endpoint: str, params: dict, priority: int) -> dict:
+    with breakers[endpoint].guard():
+        _acquire(endpoint, priority)
+        start = time.perf_counter()
+        response = session.get(API_URL + endpoint, params=params, timeout=timeouts[endpoint])
+        _check_status(response)
+        latencies[endpoint].add(time.perf_counter() - start)
+        return response.json()
+
+
+def _get_hedged(endpoint: str, params: dict, priority: int) -> dict:
+    # the second attempt only shortens the wait, so it is not sent when the budget is tight
+    delay = latencies[endpoint].percentile(95) or LOCATIONS_HEDGE_DELAY
+    return hedged(
+        endpoint,
+        delay,
+        lambda: _get(endpoint, params, priority),
+        lambda: _get(endpoint, params, EXTRA),
+    )
+
+
+def _stream(endpoint: str, params: dict, parse, priority: int):
+    with breakers[endpoint].guard():
+        _acquire(endpoint, priority)
+        start = time.perf_counter()
+        with session.get(API_URL + endpoint, params=params, timeout=timeouts[endpoint], stream=True) as response:
+            _check_status(response)
+            response.raw.decode_content = True
+            result = parse(response.raw)
+        latencies[endpoint].add(time.perf_counter() - start)
+        return result
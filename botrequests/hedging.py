@@ -0,0 +1,60 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+
+from utils.metrics import api_hedges
+
+hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+
+
+class LatencyWindow:
+    """
+    Keeps the latencies of the last successful calls to estimate their percentiles
+    """
+
+    def __init__(self, size: int = 200, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._values = deque(maxlen=size)
+        self._lock = Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, percentile: int) -> [float, None]:
+        """
+        returns the percentile of the recent latencies
+        :param percentile: percentile, e.g. 95
+        :return: latency in seconds, None until there are enough samples
+        """
+        with self._lock:
+            if len(self._values) < self.min_samples:
+                return None
+            values = sorted(self._values)
+        return values[min(len(values) * percentile // 100, len(values) - 1)]
+
+
+def hedged(name: str, delay: float, func, hedge):
+    """
+    calls func and, if it has not completed within the delay, calls hedge as well and returns the result which
+    comes first. The slower call is not interrupted, its result is dropped
+    :param name: endpoint name for the metrics
+    :param delay: seconds to wait before hedging
+    :param func: function without arguments, the original call
+    :param hedge: function without arguments, the second attempt
+    :return: result of the first successful call, the error of the original call if both failed
+    """
+    first = hedge_executor.submit(func)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    api_hedges.labels(name).inc()
+    second = hedge_executor.submit(hedge)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+    return first.result()
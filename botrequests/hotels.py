@@ -1,72 +1,249 @@
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from urllib.parse import urlencode
 
 import requests
-from dotenv import load_dotenv
 from loguru import logger
 from telebot.types import Message
 
-from utils.handling import check_in_n_out_dates, hotel_price, _, hotel_address, \
-    hotel_rating
-from bot_redis import redis_db
+from botrequests.bestdeal import BestDealSelector
+from botrequests.breaker import CircuitOpen
+from botrequests.cache import Cache
+from botrequests.client import api_get
+from botrequests.parsing import PRICE, Hotel, parse_hotels_page
+from botrequests.quota import BACKGROUND, EXTRA, PRIMARY, QuotaExceeded, quota_budget
+from botrequests.searches import load_search, save_search
+from utils.handling import check_in_n_out_dates, get_templates, log_payload, truncate
+from utils.metrics import api_errors, timed
 
-load_dotenv()
+BESTDEAL_MAX_PAGES = int(os.getenv('BESTDEAL_MAX_PAGES', 4))
+BESTDEAL_FANOUT = os.getenv('BESTDEAL_FANOUT', '1') == '1'
+# pages of one search requested at the same time, the pages after them are not requested if they are not needed
+BESTDEAL_FANOUT_WINDOW = max(int(os.getenv('BESTDEAL_FANOUT_WINDOW', 2)), 1)
 
-X_RAPIDAPI_KEY = os.getenv('RAPID_API_KEY')
+page_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BESTDEAL_FANOUT_WORKERS', 16)),
+    thread_name_prefix='bestdeal',
+)
 
+HOTELS_PAGE_SIZE = '25'
+HOTELS_CACHE_FRESH = int(os.getenv('HOTELS_CACHE_FRESH', 30 * 60))
+hotels_cache = Cache(
+    'hotel_pages',
+    ttl=int(os.getenv('HOTELS_CACHE_TTL', 6 * 60 * 60)),
+    max_size=int(os.getenv('HOTELS_CACHE_SIZE', 5000)),
+    local_size=int(os.getenv('HOTELS_CACHE_LOCAL_SIZE', 200)),
+)
 
-def get_hotels(msg: Message, parameters: dict) -> [list, None]:
+
+def get_hotels(msg: Message, parameters: dict) -> [dict, None]:
     """
-    calls the required functions to take and process the hotel data
+    calls the required functions to take and process the hotel data. If there are more hotels than requested,
+    the search is stored to show them on demand
     :param msg: Message
     :param parameters: search parameters
-    :return: list with string like hotel descriptions
+    :return: dict with hotel descriptions, search id and offset of the next hotels (None if there are no more),
+    {'error': 'bad_request'} or {'error': 'busy'} if the api failed, None if no hotels are found
     """
-    data = request_hotels(parameters)
-    if 'bad_req' in data:
-        return ['bad_request']
-    data = structure_hotels_info(msg, data)
+    quantity = int(parameters['quantity'])
+    if parameters['order'] == 'DISTANCE_FROM_LANDMARK':
+        selector = BestDealSelector(float(parameters['distance']), quantity, float(parameters['min_price']))
+        if BESTDEAL_FANOUT:
+            data = get_pages_concurrently(parameters, selector)
+        else:
+            data = get_pages(parameters, selector)
+    else:
+        data = request_hotels(parameters)
+        if 'bad_req' not in data:
+            data = structure_hotels_info(data, parameters['locale'])
+    if data and 'bad_req' in data:
+        return {'error': 'busy' if data['bad_req'] == 'busy' else 'bad_request'}
     if not data or len(data['results']) < 1:
         return None
+
+    search = {'parameters': parameters, 'hotels': data['results'], 'next_page': data['next_page']}
+    search_id = None
+    if len(search['hotels']) > quantity or search['next_page']:
+        search_id = save_search(search)
+    return show_hotels(msg, search, search_id, 0)
+
+
+def get_more_hotels(msg: Message, search_id: str, offset: int) -> [dict, None]:
+    """
+    takes the next hotels of the stored search, the next page is requested from the hotel api only when the stored
+    hotels are over
+    :param msg: Message
+    :param search_id: search id
+    :param offset: number of hotels already shown
+    :return: dict like get_hotels returns, {'error': 'search_expired'} if the search is not stored any more
+    """
+    search = load_search(search_id)
+    if search is None:
+        return {'error': 'search_expired'}
+    quantity = int(search['parameters']['quantity'])
+    if len(search['hotels']) < offset + quantity and search['next_page']:
+        page = request_hotels(search['parameters'], search['next_page'], priority=PRIMARY)
+        if 'bad_req' not in page:
+            extend_search(search, page)
+            save_search(search, search_id)
+        elif len(search['hotels']) <= offset:
+            return {'error': 'busy' if page['bad_req'] == 'busy' else 'bad_request'}
+    return show_hotels(msg, search, search_id, offset)
+
+
+def extend_search(search: dict, page: dict) -> None:
+    """
+    adds hotels of the next page to the search. For /bestdeal only hotels within the distance are added, sorted
+    by price
+    :param search: search with parameters, hotels and the next page number
+    :param page: compact page of hotels
+    :return: None
+    """
+    parameters = search['parameters']
+    page = structure_hotels_info(page, parameters['locale']) or {'results': [], 'next_page': None}
+    hotels = page['results']
+    search['next_page'] = page['next_page']
     if parameters['order'] == 'DISTANCE_FROM_LANDMARK':
-        next_page = data.get('next_page')
         distance = float(parameters['distance'])
-        while next_page and next_page < 5 \
-                and float(data['results'][-1]['distance'].replace(',', '.').split()[0]) <= distance:
-            add_data = request_hotels(parameters, next_page)
-            if 'bad_req' in data:
-                logger.warning('bad_request')
+        if hotels and hotels[-1].distance > distance:
+            search['next_page'] = None
+        hotels = sorted((hotel for hotel in hotels if hotel.distance <= distance), key=lambda hotel: hotel.price)
+    seen = set(search['hotels'])
+    search['hotels'].extend(hotel for hotel in hotels if hotel not in seen)
+
+
+def show_hotels(msg: Message, search: dict, search_id: [str, None], offset: int) -> [dict, None]:
+    """
+    generates descriptions of the requested number of hotels starting from the offset
+    :param msg: Message
+    :param search: search with parameters, hotels and the next page number
+    :param search_id: search id, None if the search is not stored
+    :param offset: number of hotels already shown
+    :return: dict with hotel descriptions, search id and offset of the next hotels, None if there are no hotels
+    """
+    quantity = int(search['parameters']['quantity'])
+    hotels = search['hotels'][offset:offset + quantity]
+    if not hotels:
+        return None
+    has_more = search_id and (len(search['hotels']) > offset + quantity or search['next_page'])
+    return {
+        'hotels': generate_hotels_descriptions(hotels, msg, search['parameters']['currency']),
+        'search_id': search_id,
+        'next_offset': offset + quantity if has_more else None,
+    }
+
+
+def get_pages(parameters: dict, selector: BestDealSelector) -> dict:
+    """
+    requests pages one by one, up to BESTDEAL_MAX_PAGES, and feeds them to the selector while the last hotel of
+    the page is not farther than the distance and the next pages can still contain cheaper hotels. If the api budget
+    is tight, the pages after the first one are taken only from the cache
+    :param parameters: search parameters
+    :param selector: BestDealSelector
+    :return: ranked hotels and the next page to request for more hotels, bad request if the first page failed
+    """
+    upstream_pages = quota_budget.page_limit(BESTDEAL_MAX_PAGES)
+    page_number = 1
+    while page_number and page_number <= BESTDEAL_MAX_PAGES:
+        page = request_hotels(parameters, page_number, cached_only=page_number > upstream_pages)
+        if page is None:
+            break
+        if 'bad_req' in page:
+            if page_number == 1:
+                return page
+            logger.warning(f'Page {page_number} is not received: {page["bad_req"]}')
+            break
+        is_needed = feed_page(parameters, selector, page)
+        page_number = page['next_page']
+        if not is_needed:
+            break
+    return {'results': selector.ranked(), 'next_page': None if selector.beyond_distance else page_number}
+
+
+def get_pages_concurrently(parameters: dict, selector: BestDealSelector) -> dict:
+    """
+    speculatively requests up to BESTDEAL_FANOUT_WINDOW pages ahead and feeds them to the selector in page order,
+    a next page is requested as soon as one is fed, up to BESTDEAL_MAX_PAGES. When the next pages are not needed,
+    the pages that are not requested yet are never requested, the ones already in flight still complete and are
+    cached. If the api budget is tight, the pages after the first one are taken only from the cache
+    :param parameters: search parameters
+    :param selector: BestDealSelector
+    :return: ranked hotels and the next page to request for more hotels, bad request if the first page failed
+    """
+    upstream_pages = quota_budget.page_limit(BESTDEAL_MAX_PAGES)
+
+    def submit(page: int):
+        return page_executor.submit(request_hotels, parameters, page, cached_only=page > upstream_pages)
+
+    futures = deque(submit(page) for page in range(1, min(BESTDEAL_FANOUT_WINDOW, BESTDEAL_MAX_PAGES) + 1))
+    submitted = len(futures)
+    next_page = 1
+    number = 0
+    try:
+        while futures:
+            page = futures.popleft().result()
+            number += 1
+            if page is None:
                 break
-            add_data = structure_hotels_info(msg, add_data)
-            if add_data and len(add_data["results"]) > 0:
-                data['results'].extend(add_data['results'])
-                next_page = add_data['next_page']
-            else:
+            if 'bad_req' in page:
+                if number == 1:
+                    return page
+                logger.warning(f'Page {number} is not received: {page["bad_req"]}')
                 break
-        quantity = int(parameters['quantity'])
-        data = choose_best_hotels(data['results'], distance, quantity)
-    else:
-        data = data['results']
+            next_page = page['next_page']
+            if not feed_page(parameters, selector, page) or not next_page:
+                break
+            if submitted < BESTDEAL_MAX_PAGES:
+                submitted += 1
+                futures.append(submit(submitted))
+    finally:
+        for future in futures:
+            future.cancel()
+    return {'results': selector.ranked(), 'next_page': None if selector.beyond_distance else next_page}
 
-    data = generate_hotels_descriptions(data, msg)
-    return data
 
+def feed_page(parameters: dict, selector: BestDealSelector, page: dict) -> bool:
+    """
+    structures the page and feeds its hotels to the selector. Pages are sorted by distance, so the next pages are
+    not needed if this one ends farther than the distance
+    :param parameters: search parameters
+    :param selector: BestDealSelector
+    :param page: compact page of hotels
+    :return: True if the next page is needed
+    """
+    page = structure_hotels_info(page, parameters['locale'])
+    if not page or len(page['results']) < 1:
+        return False
+    selector.add(page['results'])
+    if selector.is_complete:
+        logger.debug(f'Best hotels found after {selector.total} hotels, next pages are not needed')
+        return False
+    return not selector.beyond_distance
 
-def request_hotels(parameters: dict, page: int = 1):
+
+@timed('request_hotels')
+def request_hotels(parameters: dict, page: int = 1, priority: int = None, cached_only: bool = False,
+                   ttl: int = None):
     """
-    request information from the hotel api
+    request information from the hotel api or from the cache. The page size does not depend on the number of hotels
+    requested by user, so identical searches of different users share cache entries
     :param parameters: search parameters
     :param page: page number
-    :return: response from hotel api
+    :param priority: priority of the request in the api budget, PRIMARY for the first page and EXTRA for the next
+    ones by default
+    :param cached_only: do not request the hotel api if the page is not cached
+    :param ttl: seconds to keep a fetched page in the cache, HOTELS_CACHE_TTL by default, never past midnight
+    :return: response from hotel api, None if cached_only and the page is not cached
     """
-    logger.info(f'Function {request_hotels.__name__} called with argument: page = {page}, parameters = {parameters}')
-    url = "https://hotels4.p.rapidapi.com/properties/list"
     dates = check_in_n_out_dates()
 
     querystring = {
         "adults1": "1",
         "pageNumber": page,
         "destinationId": parameters['destination_id'],
-        "pageSize": parameters['quantity'],
+        "pageSize": HOTELS_PAGE_SIZE,
         "checkOut": dates['check_out'],
         "checkIn": dates['check_in'],
         "sortOrder": parameters['order'],
@@ -76,106 +253,98 @@ def request_hotels(parameters: dict, page: int = 1):
     if parameters['order'] == 'DISTANCE_FROM_LANDMARK':
         querystring['priceMax'] = parameters['max_price']
         querystring['priceMin'] = parameters['min_price']
-        querystring['pageSize'] = '25'
 
-    logger.info(f'Search parameters: {querystring}')
+    logger.opt(lazy=True).debug('Hotels search page {}: {}', lambda: page, lambda: truncate(querystring))
 
-    headers = {
-        'x-rapidapi-key': X_RAPIDAPI_KEY,
-        'x-rapidapi-host': "hotels4.p.rapidapi.com"
-    }
+    if priority is None:
+        priority = PRIMARY if page == 1 else EXTRA
+    return hotels_cache.get_or_fetch(
+        urlencode(sorted(querystring.items())),
+        None if cached_only else lambda: fetch_hotels(querystring, priority),
+        refresh=lambda: fetch_hotels(querystring, BACKGROUND),
+        ttl=min(ttl or hotels_cache.ttl, seconds_till_tomorrow()),
+        fresh_for=HOTELS_CACHE_FRESH,
+        is_valid=lambda data: 'bad_req' not in data,
+    )
 
+
+def fetch_hotels(querystring: dict, priority: int = PRIMARY) -> dict:
+    """
+    requests properties list from the hotel api, the response is parsed while it is being received and only the
+    fields used by the bot are kept
+    :param querystring: query parameters
+    :param priority: priority of the request in the api budget
+    :return: compact page of hotels, {'bad_req': 'busy'} if the budget has no room for the request, bad request
+    at once if the api is failing
+    """
     try:
-        response = requests.request("GET", url, headers=headers, params=querystring, timeout=20)
-        data = response.json()
+        data = api_get('properties/list', querystring, parse=parse_hotels_page, priority=priority)
         if data.get('message'):
             raise requests.exceptions.RequestException
 
-        logger.info(f'Hotels api(properties/list) response received: {data}')
+        log_payload('Hotels api(properties/list) response received', data)
         return data
 
+    except QuotaExceeded:
+        return {'bad_req': 'busy'}
+    except CircuitOpen:
+        return {'bad_req': 'bad_req'}
     except requests.exceptions.RequestException as e:
+        api_errors.labels('properties/list').inc()
         logger.error(f'Error receiving response: {e}')
         return {'bad_req': 'bad_req'}
     except Exception as e:
-        logger.info(f'Error in function {request_hotels.__name__}: {e}')
+        api_errors.labels('properties/list').inc()
+        logger.error(f'Error in function {fetch_hotels.__name__}: {e}')
         return {'bad_req': 'bad_req'}
 
 
-def structure_hotels_info(msg: Message, data: dict) -> dict:
+def seconds_till_tomorrow() -> int:
+    """
+    returns the number of seconds until midnight, when check-in and check-out dates roll over
+    :return: number of seconds
+    """
+    now = datetime.now()
+    return int((datetime.combine(now.date() + timedelta(1), time.min) - now).total_seconds()) + 1
+
+
+@timed('structure_hotels_info')
+def structure_hotels_info(data: dict, locale: str) -> dict:
     """
     structures hotel data
-    :param msg: Message
-    :param data: hotel data
-    :return: dict of structured hotel data
+    :param data: compact page of hotels
+    :param locale: locale of the search
+    :return: dict of structured hotel data, hotels without price are skipped
     """
-    logger.info(f'Function {structure_hotels_info.__name__} called with argument: msd = {msg}, data = {data}')
-    data = data.get('data', {}).get('body', {}).get('searchResults')
     hotels = dict()
-    hotels['total_count'] = data.get('totalCount', 0)
-
-    logger.info(f"Next page: {data.get('pagination', {}).get('nextPageNumber', 0)}")
-    hotels['next_page'] = data.get('pagination', {}).get('nextPageNumber')
+    hotels['total_count'] = data.get('total_count', 0)
+    hotels['next_page'] = data.get('next_page')
     hotels['results'] = []
 
     try:
         if hotels['total_count'] > 0:
-            for cur_hotel in data.get('results'):
-                hotel = dict()
-                hotel['name'] = cur_hotel.get('name')
-                hotel['star_rating'] = cur_hotel.get('starRating', 0)
-                hotel['price'] = hotel_price(cur_hotel)
-                if not hotel['price']:
-                    continue
-                hotel['distance'] = cur_hotel.get('landmarks')[0].get('distance', _('no_information', msg))
-                hotel['address'] = hotel_address(cur_hotel, msg)
-
-                if hotel not in hotels['results']:
-                    hotels['results'].append(hotel)
-        logger.info(f'Hotels in function {structure_hotels_info.__name__}: {hotels}')
+            # dict keeps the order of the page and drops hotels already seen on it
+            hotels['results'] = list(dict.fromkeys(
+                Hotel.from_row(record, locale) for record in data['results'] if record[PRICE]
+            ))
+        logger.opt(lazy=True).debug(
+            'Hotels structured: {} of {}, next page: {}',
+            lambda: len(hotels['results']), lambda: hotels['total_count'], lambda: hotels['next_page'],
+        )
         return hotels
 
     except Exception as e:
-        logger.info(f'Error in function {structure_hotels_info.__name__}: {e}')
+        logger.error(f'Error in function {structure_hotels_info.__name__}: {e}')
 
 
-def choose_best_hotels(hotels: list[dict], distance: float, limit: int) -> list[dict]:
-    """
-    deletes hotels that have a greater distance from the city center than the specified one, sorts the rest by price
-    in order increasing and limiting the selection
-    :param limit: number of hotels
-    :param distance: maximum distance from city center
-    :param hotels: structured hotels data
-    :return: required number of best hotels
-    """
-    logger.info(f'Function {choose_best_hotels.__name__} called with arguments: '
-                f'distance = {distance}, quantity = {limit}\n{hotels}')
-    hotels = list(filter(lambda x: float(x["distance"].strip().replace(',', '.').split()[0]) <= distance, hotels))
-    logger.info(f'Hotels filtered: {hotels}')
-    hotels = sorted(hotels, key=lambda k: k["price"])
-    logger.info(f'Hotels sorted: {hotels}')
-    if len(hotels) > limit:
-        hotels = hotels[:limit]
-    return hotels
-
-
-def generate_hotels_descriptions(hotels: dict, msg: Message) -> list[str]:
+@timed('generate_hotels_descriptions')
+def generate_hotels_descriptions(hotels: list[Hotel], msg: Message, currency: str) -> list[str]:
     """
     generate hotels description
     :param msg: Message
     :param hotels: Hotels information
+    :param currency: currency the hotels were searched in, the user may have changed it since
     :return: list with string like hotel descriptions
     """
-    logger.info(f'Function {generate_hotels_descriptions.__name__} called with argument {hotels}')
-    hotels_info = []
-
-    for hotel in hotels:
-        message = (
-            f"{_('hotel', msg)}: {hotel.get('name')}\n"
-            f"{_('rating', msg)}: {hotel_rating(hotel.get('star_rating'), msg)}\n"
-            f"{_('price', msg)}: {hotel['price']} {redis_db.hget(msg.chat.id, 'currency')}\n"
-            f"{_('distance', msg)}: {hotel.get('distance')}\n"
-            f"{_('address', msg)}: {hotel.get('address')}\n"
-        )
-        hotels_info.append(message)
-    return hotels_info
+    templates = get_templates(msg)
+    return [templates.render_hotel(hotel, currency) for hotel in hotels]
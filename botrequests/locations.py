@@ -4,13 +4,21 @@ import re
 import requests
 from telebot.types import Message
 from loguru import logger
-from dotenv import load_dotenv
 
-from bot_redis import redis_db
+from botrequests.breaker import CircuitOpen
+from botrequests.cache import Cache
+from botrequests.client import api_get
+from botrequests.quota import QuotaExceeded
+from utils.handling import log_payload, truncate
+from utils.metrics import api_errors, timed
+from utils.session import get_session
 
-load_dotenv()
-
-X_RAPIDAPI_KEY = os.getenv('RAPID_API_KEY')
+locations_cache = Cache(
+    'locations',
+    ttl=int(os.getenv('LOCATIONS_CACHE_TTL', 7 * 24 * 60 * 60)),
+    max_size=int(os.getenv('LOCATIONS_CACHE_SIZE', 10000)),
+    local_size=int(os.getenv('LOCATIONS_CACHE_LOCAL_SIZE', 1000)),
+)
 
 
 def exact_location(data: dict, loc_id: str) -> str:
@@ -31,32 +39,40 @@ def delete_tags(html_text):
     return text
 
 
-def request_locations(msg):
-    url = "https://hotels4.p.rapidapi.com/locations/search"
+def normalize_query(text: str) -> str:
+    """
+    case-folds the location query and collapses whitespaces, so that "Moscow ", "moscow" and "MOSCOW" are equal
+    :param text: location query
+    :return: normalized query
+    """
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
 
+@timed('request_locations')
+def request_locations(msg):
     querystring = {
         "query": msg.text.strip(),
-        "locale": redis_db.hget(msg.chat.id, 'locale'),
-    }
-
-    headers = {
-        'x-rapidapi-key': X_RAPIDAPI_KEY,
-        'x-rapidapi-host': "hotels4.p.rapidapi.com"
+        "locale": get_session(msg.chat.id).hget('locale'),
     }
-    logger.info(f'Parameters for search locations: {querystring}')
+    logger.opt(lazy=True).debug('Parameters for search locations: {}', lambda: querystring)
 
     try:
-        response = requests.request("GET", url, headers=headers, params=querystring, timeout=20)
-        data = response.json()
-        logger.info(f'Hotels api(locations) response received: {data}')
+        data = api_get('locations/search', querystring)
+        log_payload('Hotels api(locations) response received', data)
 
         if data.get('message'):
-            logger.error(f'Problems with subscription to hotels api {data}')
+            logger.error(f'Problems with subscription to hotels api {truncate(data)}')
             raise requests.exceptions.RequestException
         return data
+    except QuotaExceeded:
+        return {'busy': 'busy'}
+    except CircuitOpen:
+        logger.warning('Locations are not requested, hotels api is failing')
     except requests.exceptions.RequestException as e:
+        api_errors.labels('locations/search').inc()
         logger.error(f'Server error: {e}')
     except Exception as e:
+        api_errors.labels('locations/search').inc()
         logger.error(f'Error: {e}')
 
 
@@ -66,9 +82,17 @@ def make_locations_list(msg: Message) -> dict:
     :param msg: Message
     :return: dict: location name - location id
     """
+    cache_key = f"{get_session(msg.chat.id).hget('locale')}:{normalize_query(msg.text)}"
+    locations = locations_cache.get(cache_key)
+    if locations:
+        logger.debug(f'Locations for "{cache_key}" taken from cache')
+        return locations
+
     data = request_locations(msg)
     if not data:
         return {'bad_request': 'bad_request'}
+    if data.get('busy'):
+        return data
 
     try:
         locations = dict()
@@ -76,7 +100,8 @@ def make_locations_list(msg: Message) -> dict:
             for item in data.get('suggestions')[0].get('entities'):
                 location_name = delete_tags(item['caption'])
                 locations[location_name] = item['destinationId']
-            logger.info(locations)
+            logger.info(f'Locations found: {len(locations)}')
+            locations_cache.set(cache_key, locations)
             return locations
     except Exception as e:
         logger.error(f'Could not parse hotel api response. {e}')
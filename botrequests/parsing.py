@@ -0,0 +1,157 @@
+import math
+import re
+
+import ijson
+
+SEARCH_RESULTS = 'data.body.searchResults'
+HOTEL = SEARCH_RESULTS + '.results.item'
+
+# json paths of the hotel fields used by the bot and the names of the compact record fields
+hotel_fields = {
+    HOTEL + '.id': 'id',
+    HOTEL + '.name': 'name',
+    HOTEL + '.starRating': 'star_rating',
+    HOTEL + '.ratePlan.price.exactCurrent': 'exact_price',
+    HOTEL + '.ratePlan.price.current': 'current_price',
+    HOTEL + '.landmarks.item.distance': 'distance',
+    HOTEL + '.address.streetAddress': 'address',
+}
+
+# fields of a compact hotel record, records are stored as lists to keep cached pages small
+RECORD_FIELDS = ('id', 'name', 'star_rating', 'price', 'distance', 'address')
+PRICE = RECORD_FIELDS.index('price')
+
+SCALAR_EVENTS = frozenset(('string', 'number', 'boolean', 'null'))
+
+# locales that use comma as decimal separator, in the others comma separates thousands
+DECIMAL_COMMA_LOCALES = frozenset(('ru_RU',))
+METERS = frozenset(('m', 'м'))
+
+
+def parse_distance(distance: [str, None], locale: str) -> float:
+    """
+    returns distance as a number in the units of the locale, for example "1,2 км" for ru_RU or "0.8 miles" for en_US
+    :param distance: distance text from the hotel api
+    :param locale: locale of the search
+    :return: distance in km or miles, infinity if hotel has no distance
+    """
+    if not distance:
+        return math.inf
+    number, _, unit = distance.strip().replace('\xa0', ' ').rpartition(' ')
+    if not number:
+        number, unit = unit, ''
+    number = number.replace(' ', '')
+    if locale in DECIMAL_COMMA_LOCALES:
+        number = number.replace(',', '.')
+    else:
+        number = number.replace(',', '')
+    try:
+        value = float(number)
+    except ValueError:
+        return math.inf
+    if unit.strip() in METERS:
+        value /= 1000
+    return value
+
+
+class Hotel:
+    """
+    Hotel found by the search. Distance is parsed once, hotels with the same id are equal
+    """
+
+    __slots__ = ('id', 'name', 'star_rating', 'price', 'distance', 'distance_text', 'address')
+
+    def __init__(self, hotel_id, name: str, star_rating: float, price: float, distance_text: [str, None],
+                 address: [str, None], locale: str) -> None:
+        self.id = hotel_id if hotel_id is not None else (name, address)
+        self.name = name
+        self.star_rating = star_rating
+        self.price = price
+        self.distance_text = distance_text
+        self.distance = parse_distance(distance_text, locale)
+        self.address = address
+
+    @classmethod
+    def from_row(cls, row: list, locale: str) -> 'Hotel':
+        """
+        makes hotel from compact record or the row made by to_row
+        :param row: list of hotel fields in RECORD_FIELDS order
+        :param locale: locale of the search
+        :return: Hotel
+        """
+        return cls(*row, locale)
+
+    def to_row(self) -> list:
+        """
+        returns the hotel fields as a list to store it compactly
+        :return: list of hotel fields in RECORD_FIELDS order
+        """
+        hotel_id = None if isinstance(self.id, tuple) else self.id
+        return [hotel_id, self.name, self.star_rating, self.price, self.distance_text, self.address]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Hotel) and self.id == other.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return f'Hotel({self.id!r}, {self.name!r}, price={self.price}, distance={self.distance})'
+
+
+def parse_price(exact_price, current_price) -> int:
+    """
+    returns hotel price
+    :param exact_price: ratePlan.price.exactCurrent value
+    :param current_price: ratePlan.price.current value, for example "$1,024"
+    :return: integer or float like number, 0 if hotel has no price
+    """
+    if exact_price:
+        return exact_price
+    if current_price:
+        return int(re.sub(r'[^0-9]', '', current_price) or 0)
+    return 0
+
+
+def compact_hotel(fields: dict) -> list:
+    """
+    makes compact hotel record from the extracted fields
+    :param fields: dict of extracted hotel fields
+    :return: list of id, name, star_rating, price, distance and address, missing values are None
+    """
+    return [
+        fields.get('id'),
+        fields.get('name'),
+        fields.get('star_rating') or 0,
+        parse_price(fields.get('exact_price'), fields.get('current_price')),
+        fields.get('distance'),
+        fields.get('address'),
+    ]
+
+
+def parse_hotels_page(stream) -> dict:
+    """
+    parses properties list response incrementally, only the fields used by the bot are kept
+    :param stream: file-like object with response body
+    :return: dict with total_count, next_page, results (list of compact hotel records) and error message if any
+    """
+    page = {'total_count': 0, 'next_page': None, 'results': []}
+    fields = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if fields is not None:
+            if prefix == HOTEL and event == 'end_map':
+                page['results'].append(compact_hotel(fields))
+                fields = None
+            elif event in SCALAR_EVENTS and prefix in hotel_fields:
+                # only the first landmark is the distance from city center
+                fields.setdefault(hotel_fields[prefix], value)
+        elif prefix == HOTEL and event == 'start_map':
+            fields = {}
+        elif prefix == SEARCH_RESULTS + '.totalCount':
+            page['total_count'] = value
+        elif prefix == SEARCH_RESULTS + '.pagination.nextPageNumber':
+            page['next_page'] = value
+        elif prefix == 'message':
+            page['message'] = value
+    return page
+
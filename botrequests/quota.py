@@ -0,0 +1,112 @@
+import os
+import time
+from threading import Condition
+
+from loguru import logger
+
+from utils.metrics import api_granted, api_refused
+from utils.sender import TokenBucket
+
+HOTELS_API_RATE = float(os.getenv('HOTELS_API_RATE', 5))
+HOTELS_API_BURST = float(os.getenv('HOTELS_API_BURST', 5))
+HOTELS_API_QUEUE_TIMEOUT = float(os.getenv('HOTELS_API_QUEUE_TIMEOUT', 5))
+HOTELS_API_RESERVE = float(os.getenv('HOTELS_API_RESERVE', 0.1))
+
+# priorities of hotels api requests
+PRIMARY = 0  # location search and the first page of results, the user gets nothing without them
+EXTRA = 1  # next pages of /bestdeal, they only improve the selection
+BACKGROUND = 2  # refreshing of stale cache entries, users are already served from the cache
+priorities = ('primary', 'extra', 'background')
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class QuotaBudget:
+    """
+    Budget of hotels api requests shared by all users of the api key: a token bucket for the request rate and
+    the remaining monthly quota reported by RapidAPI in the response headers. When the budget is tight, requests
+    that only improve results are refused at once, so that first pages and location searches still get through.
+    Primary requests wait in line for a token up to the queue timeout
+    """
+
+    def __init__(self, rate: float, burst: float, reserve: float, queue_timeout: float) -> None:
+        self.reserve = reserve
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self._cond = Condition()
+
+    def update(self, headers) -> None:
+        """
+        takes the remaining quota from RapidAPI rate limit headers of the response
+        :param headers: response headers
+        :return: None
+        """
+        remaining = headers.get('x-ratelimit-requests-remaining')
+        if remaining is None:
+            return
+        with self._cond:
+            self.remaining = int(remaining)
+            self.limit = int(headers.get('x-ratelimit-requests-limit', 0)) or self.limit
+            reset = headers.get('x-ratelimit-requests-reset')
+            self.reset_at = time.monotonic() + int(reset) if reset else None
+
+    def _quota_left(self, now: float) -> [int, None]:
+        if self.remaining is not None and self.reset_at is not None and now >= self.reset_at:
+            self.remaining = None
+        return self.remaining
+
+    def _is_tight(self, now: float) -> bool:
+        remaining = self._quota_left(now)
+        if remaining is not None and self.limit and remaining <= self.limit * self.reserve:
+            return True
+        # one token is left for primary requests
+        self.bucket.delay(now)
+        return self.bucket.tokens < min(2, self.bucket.capacity)
+
+    @property
+    def is_tight(self) -> bool:
+        with self._cond:
+            return self._is_tight(time.monotonic())
+
+    def page_limit(self, pages: int) -> int:
+        """
+        returns how many result pages a search may request
+        :param pages: number of pages wanted
+        :return: number of pages, only the first one when the budget is tight
+        """
+        return 1 if self.is_tight else pages
+
+    def acquire(self, priority: int = PRIMARY) -> bool:
+        """
+        takes a request from the budget, primary requests wait for it up to the queue timeout
+        :param priority: PRIMARY, EXTRA or BACKGROUND
+        :return: True if the request may be sent
+        """
+        deadline = time.monotonic() + (self.queue_timeout if priority == PRIMARY else 0)
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                remaining = self._quota_left(now)
+                if (remaining is not None and remaining <= 0) or (priority != PRIMARY and self._is_tight(now)):
+                    break
+                delay = self.bucket.delay(now)
+                if delay == 0:
+                    self.bucket.take()
+                    if remaining is not None:
+                        self.remaining -= 1
+                    api_granted.labels(priorities[priority]).inc()
+                    return True
+                if now + delay > deadline:
+                    break
+                self._cond.wait(delay)
+        api_refused.labels(priorities[priority]).inc()
+        logger.warning(f'Hotels api request refused, priority {priority}, quota left: {self.remaining}')
+        return False
+
+
+quota_budget = QuotaBudget(HOTELS_API_RATE, HOTELS_API_BURST, HOTELS_API_RESERVE, HOTELS_API_QUEUE_TIMEOUT)
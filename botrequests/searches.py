@@ -0,0 +1,55 @@
+import os
+import secrets
+
+from loguru import logger
+
+from bot_redis import redis_binary
+from botrequests.parsing import Hotel
+from botrequests.serialization import cache_codec
+
+SEARCH_TTL = int(os.getenv('SEARCH_TTL', 60 * 60))
+
+# search parameters needed to request the next pages of results
+SEARCH_PARAMETERS = ('destination_id', 'order', 'locale', 'currency', 'quantity', 'min_price', 'max_price', 'distance')
+
+
+def search_key(search_id: str) -> str:
+    return f'search:{search_id}'
+
+
+def save_search(search: dict, search_id: str = None) -> str:
+    """
+    stores the search results in redis for SEARCH_TTL seconds encoded by the cache codec, hotels are stored as rows
+    of their fields
+    :param search: dict with parameters, hotels and the next page number of the hotel api
+    :param search_id: id of the stored search, a new one is generated by default
+    :return: search id, short enough for callback data of a button
+    """
+    search_id = search_id or secrets.token_urlsafe(6)
+    data = {
+        'parameters': {key: search['parameters'].get(key) for key in SEARCH_PARAMETERS},
+        'hotels': [hotel.to_row() for hotel in search['hotels']],
+        'next_page': search['next_page'],
+    }
+    redis_binary.set(search_key(search_id), cache_codec.encode(data), ex=SEARCH_TTL)
+    return search_id
+
+
+def load_search(search_id: str) -> [dict, None]:
+    """
+    loads the stored search
+    :param search_id: search id
+    :return: dict with parameters, hotels and the next page number, None if the search is expired
+    """
+    data = redis_binary.get(search_key(search_id))
+    if data is None:
+        return None
+    try:
+        search = cache_codec.decode(data)
+    except ValueError as e:
+        # stored as json text by an older version of the bot, the user starts a new search
+        logger.warning(f'Search {search_id} is not decoded: {e}')
+        return None
+    locale = search['parameters']['locale']
+    search['hotels'] = [Hotel.from_row(row, locale) for row in search['hotels']]
+    return search
@@ -0,0 +1,106 @@
+import json
+import os
+import zlib
+
+from loguru import logger
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CACHE_CODEC = os.getenv('CACHE_CODEC', 'json')
+CACHE_COMPRESSION = os.getenv('CACHE_COMPRESSION', 'zlib')
+CACHE_COMPRESSION_LEVEL = int(os.getenv('CACHE_COMPRESSION_LEVEL', 6))
+
+# values shorter than this are stored uncompressed, zlib header and checksum outweigh the gain
+COMPRESS_MIN_SIZE = 256
+
+# the first byte of a stored value names the format, the second one the compression
+JSON = ord('j')
+MSGPACK = ord('m')
+PLAIN = ord('-')
+ZLIB = ord('z')
+
+
+def json_dumps(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def msgpack_dumps(value) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def msgpack_loads(data: bytes):
+    if msgpack is None:
+        raise ValueError('msgpack is not installed')
+    return msgpack.unpackb(data, raw=False)
+
+
+serializers = {
+    'json': (JSON, json_dumps),
+    'msgpack': (MSGPACK, msgpack_dumps),
+}
+deserializers = {
+    JSON: json.loads,
+    MSGPACK: msgpack_loads,
+}
+
+
+class Codec:
+    """
+    Turns cached values into bytes and back: json or msgpack, compressed with zlib when the value is large enough.
+    The header of every value names its format, so values written with other settings are still read
+    """
+
+    def __init__(self, name: str = 'json', compression: str = None, level: int = 6) -> None:
+        self.name = name
+        self.format, self.dumps = serializers[name]
+        self.compression = compression
+        self.level = level
+
+    def encode(self, value) -> bytes:
+        """
+        serializes the value
+        :param value: json serializable value
+        :return: header and payload
+        """
+        payload = self.dumps(value)
+        if self.compression == 'zlib' and len(payload) >= COMPRESS_MIN_SIZE:
+            return bytes((self.format, ZLIB)) + zlib.compress(payload, self.level)
+        return bytes((self.format, PLAIN)) + payload
+
+    @staticmethod
+    def decode(data: bytes):
+        """
+        deserializes the value
+        :param data: value encoded by a codec with any settings
+        :return: value
+        :raise ValueError: if the data is not encoded by a codec
+        """
+        if len(data) < 2 or data[0] not in deserializers or data[1] not in (PLAIN, ZLIB):
+            raise ValueError('Unknown format of the cached value')
+        payload = memoryview(data)[2:]
+        if data[1] == ZLIB:
+            try:
+                payload = zlib.decompress(payload)
+            except zlib.error as e:
+                raise ValueError(e)
+        return deserializers[data[0]](bytes(payload))
+
+
+def make_codec(name: str, compression: str, level: int) -> Codec:
+    """
+    makes codec, json is used if msgpack is requested but not installed
+    :param name: json or msgpack
+    :param compression: zlib or none
+    :param level: zlib compression level from 1 to 9
+    :return: Codec
+    """
+    if name == 'msgpack' and msgpack is None:
+        logger.warning('msgpack is not installed, cached values are stored as json')
+        name = 'json'
+    return Codec(name, compression if compression != 'none' else None, level)
+
+
+cache_codec = make_codec(CACHE_CODEC, CACHE_COMPRESSION, CACHE_COMPRESSION_LEVEL)
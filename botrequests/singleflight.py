@@ -0,0 +1,50 @@
+from concurrent.futures import Future
+from threading import Lock
+
+from utils.metrics import flight_calls
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls: callers with the same key wait for the call that is already in flight and all
+    receive its result or its exception
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._in_flight = {}
+        self._lock = Lock()
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._in_flight
+
+    def do(self, key: str, func, *args, **kwargs):
+        """
+        calls func or joins the call with the same key that is already in flight
+        :param key: request key
+        :param func: function to call
+        :return: result of the call
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = self._in_flight[key] = Future()
+        flight_calls.labels(self.name, 'calls' if is_leader else 'collapsed').inc()
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+upstream = SingleFlight('upstream')
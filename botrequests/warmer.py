@@ -0,0 +1,88 @@
+import os
+import time
+from datetime import date, timedelta
+from threading import Thread
+
+from loguru import logger
+
+from bot_redis import redis_db
+from botrequests.hotels import request_hotels, seconds_till_tomorrow
+from botrequests.quota import BACKGROUND
+from utils.metrics import timed
+
+WARMER_ENABLED = os.getenv('WARMER_ENABLED', '1') == '1'
+WARMER_TOP = int(os.getenv('WARMER_TOP', 20))
+WARMER_BUDGET = int(os.getenv('WARMER_BUDGET', 100))
+WARMER_RATE = float(os.getenv('WARMER_RATE', 1))
+WARMER_DELAY = int(os.getenv('WARMER_DELAY', 5 * 60))
+
+# sort orders which do not depend on user input, /bestdeal searches have user price ranges and are not warmed
+WARMER_ORDERS = ('PRICE', 'PRICE_HIGHEST_FIRST')
+POPULARITY_TTL = 3 * 24 * 60 * 60
+
+
+def popularity_key(day: date) -> str:
+    return f'stats:destinations:{day.isoformat()}'
+
+
+def record_destination(destination_id: str, locale: str, currency: str) -> None:
+    """
+    counts the selection of the destination for the current day, the locale and the currency are kept with it
+    because they are a part of the search cache key
+    :param destination_id: destination id
+    :param locale: user locale
+    :param currency: user currency
+    :return: None
+    """
+    key = popularity_key(date.today())
+    pipe = redis_db.pipeline(transaction=False)
+    pipe.zincrby(key, 1, f'{destination_id}:{locale}:{currency}')
+    pipe.expire(key, POPULARITY_TTL)
+    pipe.execute()
+
+
+@timed('warm_up')
+def warm_up(day: date = None) -> int:
+    """
+    requests the first result pages of the most popular destinations of the previous day for every sort order,
+    the most popular destinations first, until WARMER_BUDGET pages are requested or the api budget is tight.
+    Only one process warms the cache every day
+    :param day: day to warm the cache for, today by default
+    :return: number of pages requested
+    """
+    day = day or date.today()
+    if not redis_db.set(f'warmer:{day.isoformat()}', 1, nx=True, ex=24 * 60 * 60):
+        logger.info('Cache is already warmed by another process')
+        return 0
+
+    popular = redis_db.zrevrange(popularity_key(day - timedelta(1)), 0, WARMER_TOP - 1)
+    searches = [(member, order) for member in popular for order in WARMER_ORDERS][:WARMER_BUDGET]
+    for pages, (member, order) in enumerate(searches, 1):
+        destination_id, locale, currency = member.split(':')
+        parameters = {'destination_id': destination_id, 'order': order, 'locale': locale, 'currency': currency}
+        # warmed pages are kept for the whole day, stale ones are refreshed when users read them
+        page = request_hotels(parameters, priority=BACKGROUND, ttl=seconds_till_tomorrow())
+        if page.get('bad_req') == 'busy':
+            logger.warning(f'Cache warming stopped after {pages} pages, hotels api budget is tight')
+            return pages
+        time.sleep(1 / WARMER_RATE)
+    logger.info(f'Cache warmed: {len(searches)} pages for {len(popular)} destinations')
+    return len(searches)
+
+
+def run_warmer() -> None:
+    while True:
+        time.sleep(seconds_till_tomorrow() + WARMER_DELAY)
+        try:
+            warm_up()
+        except Exception as e:
+            logger.opt(exception=True).error(f'Cache warming failed: {e}')
+
+
+def start_warmer() -> None:
+    """
+    starts the thread which warms the cache WARMER_DELAY seconds after midnight, when search dates roll over
+    :return: None
+    """
+    if WARMER_ENABLED:
+        Thread(target=run_warmer, name='warmer', daemon=True).start()
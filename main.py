@@ -1,20 +1,44 @@
 import os
+import time
 
 import telebot
 from telebot.types import Message, CallbackQuery
 from dotenv import load_dotenv
 from loguru import logger
 
-from botrequests.hotels import get_hotels
+from bot_redis import migrate_keys, redis_db
+from botrequests.hotels import get_hotels, get_more_hotels
 from botrequests.locations import exact_location, make_locations_list
+from botrequests.warmer import record_destination, start_warmer
 from utils.handling import internationalize as _, is_input_correct, get_parameters_information, \
-    make_message, steps, locales, logger_config, currencies, is_user_in_db, add_user, extract_search_parameters
-from bot_redis import redis_db
+    make_message, steps, locales, logger_config, currencies, is_user_in_db, add_user, extract_search_parameters, \
+    pack_messages
+from utils.dispatcher import ChatDispatcher
+from utils.metrics import queue_depth, start_metrics_server
+from utils.sender import SendQueue, OutboundBot, BULK
+from utils.session import chat_session, get_session
+from utils.sweeper import start_sweeper
+from utils.webhook import make_webhook_server
 
 logger.configure(**logger_config)
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-bot = telebot.TeleBot(BOT_TOKEN, parse_mode='HTML')
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 8))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', f'/{BOT_TOKEN}/')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+HOTELS_DELIVERY = os.getenv('HOTELS_DELIVERY', 'batch')
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', 30))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', 1))
+SEND_CHAT_BURST = float(os.getenv('SEND_CHAT_BURST', 3))
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', 4))
+
+
+bot = telebot.TeleBot(BOT_TOKEN, parse_mode='HTML', threaded=False)
+outbound = OutboundBot(bot, SendQueue(SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_WORKERS))
 
 
 def get_locations(msg: Message) -> None:
@@ -24,15 +48,17 @@ def get_locations(msg: Message) -> None:
     :return: None
     """
     if not is_input_correct(msg):
-        bot.send_message(msg.chat.id, make_message(msg, 'mistake_'))
+        outbound.send_message(msg.chat.id, make_message(msg, 'mistake_'))
     else:
-        wait_msg = bot.send_message(msg.chat.id, _('wait', msg))
+        wait_msg = outbound.send_message(msg.chat.id, _('wait', msg))
         locations = make_locations_list(msg)
-        bot.delete_message(msg.chat.id, wait_msg.id)
+        outbound.delete_message(msg.chat.id, wait_msg)
         if not locations or len(locations) < 1:
-            bot.send_message(msg.chat.id, str(msg.text) + _('locations_not_found', msg))
+            outbound.send_message(msg.chat.id, str(msg.text) + _('locations_not_found', msg))
         elif locations.get('bad_request'):
-            bot.send_message(msg.chat.id, _('bad_request', msg))
+            outbound.send_message(msg.chat.id, _('bad_request', msg))
+        elif locations.get('busy'):
+            outbound.send_message(msg.chat.id, _('busy', msg))
         else:
             menu = telebot.types.InlineKeyboardMarkup()
             for loc_name, loc_id in locations.items():
@@ -41,10 +67,11 @@ def get_locations(msg: Message) -> None:
                     callback_data='code' + loc_id)
                 )
             menu.add(telebot.types.InlineKeyboardButton(text=_('cancel', msg), callback_data='cancel'))
-            bot.send_message(msg.chat.id, _('loc_choose', msg), reply_markup=menu)
+            outbound.send_message(msg.chat.id, _('loc_choose', msg), reply_markup=menu)
 
 
 @bot.message_handler(commands=['settings'])
+@chat_session
 def get_command_settings(message: Message) -> None:
     """
     "/settings" command handler, opens settings menu
@@ -53,15 +80,16 @@ def get_command_settings(message: Message) -> None:
     """
     if not is_user_in_db(message):
         add_user(message)
-    logger.info(f'Функция {get_command_settings.__name__} вызвана с параметром: {message}')
+    logger.info('"settings" command is called')
     menu = telebot.types.InlineKeyboardMarkup()
     menu.add(telebot.types.InlineKeyboardButton(text=_("language_", message), callback_data='set_locale'))
     menu.add(telebot.types.InlineKeyboardButton(text=_("currency_", message), callback_data='set_currency'))
     menu.add(telebot.types.InlineKeyboardButton(text=_("cancel", message), callback_data='cancel'))
-    bot.send_message(message.chat.id, _("settings", message), reply_markup=menu)
+    outbound.send_message(message.chat.id, _("settings", message), reply_markup=menu)
 
 
 @bot.message_handler(commands=['lowprice', 'highprice', 'bestdeal'])
+@chat_session
 def get_searching_commands(message: Message) -> None:
     """
     "/lowprice", "/highprice", "/bestdeal"  commands handler, sets the sort order and starts asking for parameters
@@ -70,27 +98,25 @@ def get_searching_commands(message: Message) -> None:
     :param message: Message
     :return: None
     """
-    logger.info("\n" + "=" * 100 + "\n")
     if not is_user_in_db(message):
         add_user(message)
     chat_id = message.chat.id
-    redis_db.hset(chat_id, 'state', 1)
+    session = get_session(chat_id)
+    session.hset('state', 1)
     if 'lowprice' in message.text:
-        redis_db.hset(chat_id, 'order', 'PRICE')
+        session.hset('order', 'PRICE')
         logger.info('"lowprice" command is called')
     elif 'highprice' in message.text:
-        redis_db.hset(chat_id, 'order', 'PRICE_HIGHEST_FIRST')
+        session.hset('order', 'PRICE_HIGHEST_FIRST')
         logger.info('"highprice" command is called')
     else:
-        redis_db.hset(chat_id, 'order', 'DISTANCE_FROM_LANDMARK')
+        session.hset('order', 'DISTANCE_FROM_LANDMARK')
         logger.info('"bestdeal" command is called')
-    logger.info(redis_db.hget(chat_id, 'order'))
-    state = redis_db.hget(chat_id, 'state')
-    logger.info(f"Current state: {state}")
-    bot.send_message(chat_id, make_message(message, 'question_'))
+    outbound.send_message(chat_id, make_message(message, 'question_'))
 
 
 @bot.message_handler(commands=['help', 'start'])
+@chat_session
 def get_command_help(message: Message) -> None:
     """
     "/help" command handler, displays information about bot commands in the chat
@@ -101,43 +127,50 @@ def get_command_help(message: Message) -> None:
         add_user(message)
     if 'start' in message.text:
         logger.info(f'"start" command is called')
-        bot.send_message(message.chat.id, _('hello', message))
+        outbound.send_message(message.chat.id, _('hello', message))
     else:
         logger.info(f'"help" command is called')
-        bot.send_message(message.chat.id, _('help', message))
+        outbound.send_message(message.chat.id, _('help', message))
 
 
 @bot.callback_query_handler(func=lambda call: True)
+@chat_session
 def keyboard_handler(call: CallbackQuery) -> None:
     """
     buttons handlers
     :param call: CallbackQuery
     :return: None
     """
-    logger.info(f'Function {keyboard_handler.__name__} called with argument: {call}')
+    logger.info(f'Button "{call.data}" pressed')
     chat_id = call.message.chat.id
-    bot.edit_message_reply_markup(chat_id=chat_id, message_id=call.message.message_id)
+    session = get_session(chat_id)
+    outbound.edit_message_reply_markup(chat_id, call.message.message_id)
 
     if call.data.startswith('code'):
-        if redis_db.hget(chat_id, 'state') != '1':
-            bot.send_message(call.message.chat.id, _('enter_command', call.message))
-            redis_db.hset(chat_id, 'state', 0)
+        if session.hget('state') != '1':
+            outbound.send_message(call.message.chat.id, _('enter_command', call.message))
+            session.hset('state', 0)
         else:
             loc_name = exact_location(call.message.json, call.data)
-            redis_db.hset(chat_id, mapping={"destination_id": call.data[4:], "destination_name": loc_name})
+            session.hset(mapping={"destination_id": call.data[4:], "destination_name": loc_name})
             logger.info(f"{loc_name} selected")
-            bot.send_message(
+            record_destination(call.data[4:], session.hget('locale'), session.hget('currency'))
+            outbound.send_message(
                 chat_id,
                 f"{_('loc_selected', call.message)}: {loc_name}",
             )
-            if redis_db.hget(chat_id, 'order') == 'DISTANCE_FROM_LANDMARK':
-                redis_db.hincrby(chat_id, 'state', 1)
+            if session.hget('order') == 'DISTANCE_FROM_LANDMARK':
+                session.hincrby('state', 1)
             else:
-                redis_db.hincrby(chat_id, 'state', 3)
-            bot.send_message(chat_id, make_message(call.message, 'question_'))
+                session.hincrby('state', 3)
+            outbound.send_message(chat_id, make_message(call.message, 'question_'))
+
+    elif call.data.startswith('more'):
+        search_id, offset = call.data.split(':')[1:]
+        more_hotels(call.message, search_id, int(offset))
 
     elif call.data.startswith('set'):
-        redis_db.hset(chat_id, 'state', 0)
+        session.hset('state', 0)
         menu = telebot.types.InlineKeyboardMarkup()
         if call.data == 'set_locale':
             logger.info(f'language change menu')
@@ -149,23 +182,22 @@ def keyboard_handler(call: CallbackQuery) -> None:
             menu.add(telebot.types.InlineKeyboardButton(text='USD', callback_data='cur_USD'))
             menu.add(telebot.types.InlineKeyboardButton(text='EUR', callback_data='cur_EUR'))
         menu.add(telebot.types.InlineKeyboardButton(text=_('cancel', call.message), callback_data='cancel'))
-        bot.send_message(chat_id, _('ask_to_select', call.message), reply_markup=menu)
+        outbound.send_message(chat_id, _('ask_to_select', call.message), reply_markup=menu)
 
     elif call.data.startswith('loc'):
-        redis_db.hset(chat_id, mapping={"locale": call.data[4:], "language": call.data[4:6]})
-        bot.send_message(chat_id, f"{_('current_language', call.message)}: {_('language', call.message)}")
-        logger.info(f"Language changed to {redis_db.hget(chat_id, 'language')}")
-        logger.info(f"Locale changed to {redis_db.hget(chat_id, 'locale')}")
+        session.hset(mapping={"locale": call.data[4:], "language": call.data[4:6]})
+        outbound.send_message(chat_id, f"{_('current_language', call.message)}: {_('language', call.message)}")
+        logger.info(f"Language changed to {session.hget('language')}, locale changed to {session.hget('locale')}")
 
     elif call.data.startswith('cur'):
-        redis_db.hset(chat_id, 'currency', call.data[4:])
-        bot.send_message(chat_id, f"{_('current_currency', call.message)}: {call.data[4:]}")
-        logger.info(f"Currency changed to {redis_db.hget(chat_id, 'currency')}")
+        session.hset('currency', call.data[4:])
+        outbound.send_message(chat_id, f"{_('current_currency', call.message)}: {call.data[4:]}")
+        logger.info(f"Currency changed to {session.hget('currency')}")
 
     elif call.data == 'cancel':
         logger.info(f'Canceled by user')
-        redis_db.hset(chat_id, 'state', 0)
-        bot.send_message(chat_id, _('canceled', call.message))
+        session.hset('state', 0)
+        outbound.send_message(chat_id, _('canceled', call.message))
 
 
 def get_search_parameters(msg: Message) -> None:
@@ -174,29 +206,29 @@ def get_search_parameters(msg: Message) -> None:
     :param msg: Message
     :return: None
     """
-    logger.info(f'Function {get_command_settings.__name__} called with argument: {msg}')
     chat_id = msg.chat.id
-    state = redis_db.hget(chat_id, 'state')
+    session = get_session(chat_id)
+    state = session.hget('state')
     if not is_input_correct(msg):
-        bot.send_message(chat_id, make_message(msg, 'mistake_'))
+        outbound.send_message(chat_id, make_message(msg, 'mistake_'))
     else:
-        redis_db.hincrby(msg.chat.id, 'state', 1)
+        session.hincrby('state', 1)
         if state == '2':
             min_price, max_price = sorted(msg.text.strip().split(), key=int)
-            redis_db.hset(chat_id, steps[state + 'min'], min_price)
+            session.hset(steps[state + 'min'], min_price)
             logger.info(f"{steps[state + 'min']} set to {min_price}")
-            redis_db.hset(chat_id, steps[state + 'max'], max_price)
+            session.hset(steps[state + 'max'], max_price)
             logger.info(f"{steps[state + 'max']} set to {max_price}")
-            bot.send_message(chat_id, make_message(msg, 'question_'))
+            outbound.send_message(chat_id, make_message(msg, 'question_'))
         elif state == '4':
-            redis_db.hset(chat_id, steps[state], msg.text.strip())
+            session.hset(steps[state], msg.text.strip())
             logger.info(f"{steps[state]} set to {msg.text.strip()}")
-            redis_db.hset(chat_id, 'state', 0)
+            session.hset('state', 0)
             hotels_list(msg)
         else:
-            redis_db.hset(chat_id, steps[state], msg.text.strip())
+            session.hset(steps[state], msg.text.strip())
             logger.info(f"{steps[state]} set to {msg.text.strip()}")
-            bot.send_message(chat_id, make_message(msg, 'question_'))
+            outbound.send_message(chat_id, make_message(msg, 'question_'))
 
 
 def hotels_list(msg: Message) -> None:
@@ -206,24 +238,63 @@ def hotels_list(msg: Message) -> None:
     :return: None
     """
     chat_id = msg.chat.id
-    wait_msg = bot.send_message(chat_id, _('wait', msg))
+    wait_msg = outbound.send_message(chat_id, _('wait', msg))
     params = extract_search_parameters(msg)
-    hotels = get_hotels(msg, params)
-    logger.info(f'Function {get_hotels.__name__} returned: {hotels}')
-    bot.delete_message(chat_id, wait_msg.id)
-    if not hotels or len(hotels) < 1:
-        bot.send_message(chat_id, _('hotels_not_found', msg))
-    elif 'bad_request' in hotels:
-        bot.send_message(chat_id, _('bad_request', msg))
+    result = get_hotels(msg, params)
+    logger.info(f'Hotels found: {len(result["hotels"]) if result and "hotels" in result else 0}')
+    outbound.delete_message(chat_id, wait_msg)
+    if not result:
+        outbound.send_message(chat_id, _('hotels_not_found', msg))
+    elif 'error' in result:
+        outbound.send_message(chat_id, _(result['error'], msg))
+    else:
+        quantity = len(result['hotels'])
+        send_hotels(msg, [get_parameters_information(msg), f"{_('hotels_found', msg)}: {quantity}"], result)
+
+
+def more_hotels(msg: Message, search_id: str, offset: int) -> None:
+    """
+    displays the next hotels of the search in chat
+    :param msg: Message with the pressed button
+    :param search_id: search id
+    :param offset: number of hotels already shown
+    :return: None
+    """
+    result = get_more_hotels(msg, search_id, offset)
+    logger.info(f'Next hotels of search {search_id}: {len(result["hotels"]) if result and "hotels" in result else 0}')
+    if not result:
+        outbound.send_message(msg.chat.id, _('hotels_not_found', msg))
+    elif 'error' in result:
+        outbound.send_message(msg.chat.id, _(result['error'], msg))
     else:
-        quantity = len(hotels)
-        bot.send_message(chat_id, get_parameters_information(msg))
-        bot.send_message(chat_id, f"{_('hotels_found', msg)}: {quantity}")
-        for hotel in hotels:
-            bot.send_message(chat_id, hotel)
+        send_hotels(msg, [], result)
+
+
+def send_hotels(msg: Message, header: list, result: dict) -> None:
+    """
+    sends hotel descriptions, the last message gets a button to show the next hotels if there are more of them
+    :param msg: Message
+    :param header: messages sent before the hotels
+    :param result: dict with hotel descriptions, search id and offset of the next hotels
+    :return: None
+    """
+    messages = [*header, *result['hotels']]
+    if HOTELS_DELIVERY == 'batch':
+        messages = pack_messages(messages)
+    menu = None
+    if result['next_offset'] is not None:
+        menu = telebot.types.InlineKeyboardMarkup()
+        menu.add(telebot.types.InlineKeyboardButton(
+            text=_('more_hotels', msg),
+            callback_data=f"more:{result['search_id']}:{result['next_offset']}",
+        ))
+    for number, message in enumerate(messages, 1):
+        outbound.send_message(msg.chat.id, message, priority=BULK,
+                              reply_markup=menu if number == len(messages) else None)
 
 
 @bot.message_handler(content_types=['text'])
+@chat_session
 def get_text_messages(message) -> None:
     """
     text messages handler
@@ -232,17 +303,70 @@ def get_text_messages(message) -> None:
     """
     if not is_user_in_db(message):
         add_user(message)
-    state = redis_db.hget(message.chat.id, 'state')
+    state = get_session(message.chat.id).hget('state')
     if state == '1':
         get_locations(message)
     elif state in ['2', '3', '4']:
         get_search_parameters(message)
     else:
-        bot.send_message(message.chat.id, _('misunderstanding', message))
+        outbound.send_message(message.chat.id, _('misunderstanding', message))
+
+
+def run_polling(dispatcher: ChatDispatcher) -> None:
+    """
+    receives updates from telegram with long polling and passes them to the dispatcher
+    :param dispatcher: ChatDispatcher
+    :return: None
+    """
+    bot.remove_webhook()
+    logger.info('Polling started')
+    offset = None
+    error_interval = 0.25
+    while True:
+        try:
+            updates = bot.get_updates(offset=offset, timeout=30, long_polling_timeout=20)
+            error_interval = 0.25
+        except Exception as e:
+            logger.error(f'Error receiving updates: {e}, retry in {error_interval} s')
+            time.sleep(error_interval)
+            error_interval = min(error_interval * 2, 30)
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            dispatcher.submit(update)
 
 
-try:
-    bot.polling(none_stop=True, interval=0)
-except Exception as e:
-    logger.opt(exception=True).error(f'Unexpected error: {e}')
+def run_webhook(dispatcher: ChatDispatcher) -> None:
+    """
+    receives updates from telegram through the webhook and passes them to the dispatcher. If WEBHOOK_URL is set,
+    registers the webhook in telegram
+    :param dispatcher: ChatDispatcher
+    :return: None
+    """
+    server = make_webhook_server(WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, dispatcher)
+    if WEBHOOK_URL:
+        bot.remove_webhook()
+        bot.set_webhook(url=WEBHOOK_URL + WEBHOOK_PATH, max_connections=WEBHOOK_MAX_CONNECTIONS)
+    logger.info(f'Webhook server started on {WEBHOOK_HOST}:{WEBHOOK_PORT}')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    migrate_keys(redis_db)
+    update_dispatcher = ChatDispatcher(lambda update: bot.process_new_updates([update]), BOT_WORKERS)
+    queue_depth.labels('updates').set_function(lambda: update_dispatcher.depth)
+    queue_depth.labels('send').set_function(lambda: outbound.queue.depth)
+    start_metrics_server()
+    start_warmer()
+    start_sweeper()
+    try:
+        if BOT_MODE == 'webhook':
+            run_webhook(update_dispatcher)
+        else:
+            run_polling(update_dispatcher)
+    except Exception as e:
+        logger.opt(exception=True).error(f'Unexpected error: {e}')
 
@@ -0,0 +1,16 @@
+import pytest
+
+from tests.helpers import memory_redis
+from utils import session
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """
+    in-memory redis behind the chat sessions
+    """
+    db = memory_redis()
+    monkeypatch.setattr(session, 'redis_db', db)
+    monkeypatch.setattr(session, 'cas_state', db.register_script(session.CAS_STATE_SCRIPT))
+    monkeypatch.setattr(session, 'is_cluster', False)
+    return db
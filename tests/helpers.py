@@ -0,0 +1,37 @@
+from benchmarks.memredis import MemoryRedis
+
+
+def cas_state(db: MemoryRedis, keys: list, args: list) -> int:
+    """
+    python stand-in of CAS_STATE_SCRIPT for MemoryRedis, which does not run lua. tests/test_session_script.py checks
+    that both give the same results
+    """
+    hash_ = db.data.get(db._key(keys[0]), {})
+    if hash_.get('state', '') != args[0]:
+        return 0
+    hash_ = db.data.setdefault(db._key(keys[0]), hash_)
+    hash_.update(zip(args[2::2], map(str, args[3::2])))
+    state = hash_['state']
+    if state == '0':
+        MemoryRedis.delete(db, keys[0])
+    else:
+        MemoryRedis.expire(db, keys[0], int(args[1]))
+    if len(keys) > 1 and state != args[0]:
+        counts = db.data.setdefault(db._key(keys[1]), {})
+        if args[0] not in ('', '0'):
+            counts[args[0]] = str(int(counts.get(args[0], 0)) - 1)
+        if state != '0':
+            counts[state] = str(int(counts.get(state, 0)) + 1)
+    return 1
+
+
+def memory_redis() -> MemoryRedis:
+    """
+    returns in-memory redis which runs the stand-ins of the bot's scripts
+    """
+    # imported here, the benchmark replaces the redis clients before the bot modules are imported
+    from utils.session import CAS_STATE_SCRIPT
+
+    db = MemoryRedis()
+    db.scripts[CAS_STATE_SCRIPT] = cas_state
+    return db
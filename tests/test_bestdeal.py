@@ -0,0 +1,44 @@
+from botrequests.bestdeal import BestDealSelector
+from botrequests.parsing import Hotel
+
+
+def hotel(hotel_id: int, price: float, distance: float) -> Hotel:
+    return Hotel(hotel_id, f'Hotel {hotel_id}', 3.0, price, f'{distance} km', None, 'en_US')
+
+
+def test_keeps_cheapest_hotels_within_distance():
+    selector = BestDealSelector(distance=2, limit=2)
+    selector.add([hotel(1, 300, 0.5), hotel(2, 100, 1), hotel(3, 50, 3), hotel(4, 200, 1.5)])
+    assert [h.id for h in selector.best()] == [2, 4]
+    assert [h.id for h in selector.ranked()] == [2, 4, 1]
+
+
+def test_equal_prices_keep_arrival_order():
+    selector = BestDealSelector(distance=5, limit=2)
+    selector.add([hotel(1, 100, 1), hotel(2, 100, 1)])
+    selector.add([hotel(3, 100, 1)])
+    assert [h.id for h in selector.ranked()] == [1, 2, 3]
+
+
+def test_hotels_repeated_on_next_page_are_skipped():
+    selector = BestDealSelector(distance=5, limit=3)
+    selector.add([hotel(1, 100, 1), hotel(2, 200, 1)])
+    selector.add([hotel(2, 200, 1), hotel(3, 150, 2)])
+    assert [h.id for h in selector.ranked()] == [1, 3, 2]
+    assert selector.total == 3
+
+
+def test_page_ending_beyond_distance_stops_paging():
+    selector = BestDealSelector(distance=2, limit=5)
+    selector.add([hotel(1, 100, 1), hotel(2, 100, 1.5)])
+    assert not selector.beyond_distance
+    selector.add([hotel(3, 100, 1.8), hotel(4, 100, 2.5)])
+    assert selector.beyond_distance
+
+
+def test_complete_when_enough_hotels_at_price_floor():
+    selector = BestDealSelector(distance=5, limit=2, price_floor=100)
+    selector.add([hotel(1, 100, 1), hotel(2, 150, 1)])
+    assert not selector.is_complete
+    selector.add([hotel(3, 100, 2)])
+    assert selector.is_complete
@@ -0,0 +1,54 @@
+import os
+import time
+
+import pytest
+import redis
+
+from bot_redis import BlockingSentinelConnectionPool, parse_nodes
+
+
+class Connection:
+    def __init__(self, **kwargs) -> None:
+        self.host, self.port = 'master', 6379
+        self.pid = os.getpid()
+        self.connected = False
+
+    def connect(self) -> None:
+        self.connected = True
+
+    def can_read(self) -> bool:
+        return False
+
+    def disconnect(self) -> None:
+        self.connected = False
+
+
+class Sentinels:
+    def discover_master(self, service_name: str) -> tuple:
+        return 'master', 6379
+
+
+def make_pool(**kwargs) -> BlockingSentinelConnectionPool:
+    return BlockingSentinelConnectionPool('mymaster', Sentinels(), connection_class=Connection, **kwargs)
+
+
+def test_sentinel_pool_waits_for_free_connection():
+    pool = make_pool(max_connections=1, timeout=0.2)
+    pool.get_connection('GET')
+    start = time.monotonic()
+    with pytest.raises(redis.ConnectionError):
+        pool.get_connection('GET')
+    assert time.monotonic() - start >= 0.2
+
+
+def test_master_change_disconnects_only_idle_connections():
+    pool = make_pool(max_connections=2, timeout=0.1)
+    busy, idle = pool.get_connection('GET'), pool.get_connection('GET')
+    pool.get_master_address()
+    pool.release(idle)
+    pool.disconnect(inuse_connections=False)
+    assert busy.connected and not idle.connected
+
+
+def test_parse_nodes():
+    assert parse_nodes('10.0.0.1:26379, 10.0.0.2:26380,') == [('10.0.0.1', 26379), ('10.0.0.2', 26380)]
@@ -0,0 +1,75 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+from botrequests import client
+
+
+class Budget:
+    def __init__(self, allow: bool) -> None:
+        self.allow = allow
+        self.acquired = 0
+
+    def acquire(self, priority: int) -> bool:
+        self.acquired += 1
+        return self.allow
+
+
+@pytest.fixture
+def api():
+    """
+    local server answering with the queued statuses, then 200
+    """
+    statuses = []
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            calls.append(self.path)
+            self.send_response(statuses.pop(0) if statuses else 200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/properties/list', statuses, calls
+    server.shutdown()
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(client, 'BACKOFF_FACTOR', 0)
+    return client.make_session()
+
+
+def test_resends_are_taken_from_the_budget(api, session, monkeypatch):
+    url, statuses, calls = api
+    budget = Budget(allow=True)
+    monkeypatch.setattr(client, 'quota_budget', budget)
+    statuses.extend([503, 502])
+    assert session.get(url).status_code == 200
+    assert len(calls) == 3
+    assert budget.acquired == 2
+
+
+def test_no_resend_when_the_budget_is_tight(api, session, monkeypatch):
+    url, statuses, calls = api
+    monkeypatch.setattr(client, 'quota_budget', Budget(allow=False))
+    statuses.append(503)
+    assert session.get(url).status_code == 503
+    assert len(calls) == 1
+
+
+def test_too_many_requests_is_not_resent(api, session, monkeypatch):
+    url, statuses, calls = api
+    budget = Budget(allow=True)
+    monkeypatch.setattr(client, 'quota_budget', budget)
+    statuses.append(429)
+    assert session.get(url).status_code == 429
+    assert len(calls) == 1
+    assert budget.acquired == 0
@@ -0,0 +1,23 @@
+from utils.handling import pack_messages, split_lines
+
+
+def test_pack_messages_joins_short_parts():
+    assert pack_messages(['a', 'b', 'c'], limit=5) == ['a\nb\nc']
+    assert pack_messages(['aa', 'bb', 'cc'], limit=5) == ['aa\nbb', 'cc']
+
+
+def test_pack_messages_keeps_order_around_long_part():
+    messages = pack_messages(['A' * 10, 'B' * 20, 'C' * 30], limit=25)
+    assert ''.join(messages) == 'A' * 10 + 'B' * 20 + 'C' * 30
+    assert all(len(message) <= 25 for message in messages)
+
+
+def test_pack_messages_splits_long_part_on_lines():
+    card = '<b>Hotel</b>\n<i>Address</i>\n<a href="https://hotels.com/ho1">link</a>'
+    messages = pack_messages(['intro', card], limit=45)
+    assert messages == ['intro', '<b>Hotel</b>\n<i>Address</i>', '<a href="https://hotels.com/ho1">link</a>']
+
+
+def test_split_lines_cuts_long_line_at_space():
+    assert split_lines('one two three', limit=7) == ['one two', 'three']
+    assert split_lines('x' * 12, limit=5) == ['xxxxx', 'xxxxx', 'xx']
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import pytest
+
+from botrequests import hotels, searches
+from utils.session import ChatSession
+
+CHAT_ID = 42
+
+
+def page(number: int) -> dict:
+    return {
+        'total_count': 4,
+        'next_page': number + 1 if number < 2 else None,
+        'results': [[number * 10 + index, f'Hotel {number}{index}', 3, 1000 * number + index, '1 km', None]
+                    for index in range(2)],
+    }
+
+
+@pytest.fixture
+def msg(db, monkeypatch):
+    monkeypatch.setattr(searches, 'redis_binary', db.binary())
+    monkeypatch.setattr(hotels, 'request_hotels', lambda parameters, number=1, **kwargs: page(number))
+    ChatSession(CHAT_ID, buffered=False).hset(mapping={'language': 'en', 'locale': 'en_US', 'currency': 'RUB'})
+    return SimpleNamespace(chat=SimpleNamespace(id=CHAT_ID))
+
+
+def test_more_hotels_keep_currency_of_the_search(msg):
+    parameters = {'destination_id': '1', 'order': 'PRICE', 'locale': 'en_US', 'currency': 'RUB', 'quantity': '2'}
+    found = hotels.get_hotels(msg, parameters)
+    assert all('RUB' in card for card in found['hotels'])
+
+    ChatSession(CHAT_ID, buffered=False).hset('currency', 'USD')
+    more = hotels.get_more_hotels(msg, found['search_id'], found['next_offset'])
+    assert len(more['hotels']) == 2
+    assert all('RUB' in card and 'USD' not in card for card in more['hotels'])
@@ -0,0 +1,49 @@
+import io
+import json
+import math
+
+from botrequests.parsing import parse_distance, parse_hotels_page
+
+RESPONSE = {
+    'result': 'OK',
+    'data': {'body': {'searchResults': {
+        'totalCount': 2,
+        'pagination': {'currentPage': 1, 'nextPageNumber': 2},
+        'results': [
+            {
+                'id': 101, 'name': 'Grand', 'starRating': 4.5,
+                'address': {'streetAddress': 'Main st, 1', 'locality': 'Paris'},
+                'landmarks': [{'label': 'City center', 'distance': '0.8 miles'}, {'distance': '5 miles'}],
+                'ratePlan': {'price': {'current': '$1,024', 'exactCurrent': 1024.5}},
+                'optimizedThumbUrls': {'srpDesktop': 'https://example.com/1.jpg'},
+            },
+            {'id': 102, 'name': 'Hostel', 'ratePlan': {'price': {'current': '$30'}}},
+        ],
+    }}},
+}
+
+
+def parse(response: dict) -> dict:
+    return parse_hotels_page(io.BytesIO(json.dumps(response).encode()))
+
+
+def test_keeps_only_used_fields():
+    assert parse(RESPONSE) == {
+        'total_count': 2,
+        'next_page': 2,
+        'results': [
+            [101, 'Grand', 4.5, 1024.5, '0.8 miles', 'Main st, 1'],
+            [102, 'Hostel', 0, 30, None, None],
+        ],
+    }
+
+
+def test_error_message_is_kept():
+    assert parse({'message': 'You are not subscribed to this API.'})['message'] == 'You are not subscribed to this API.'
+
+
+def test_parse_distance_by_locale():
+    assert parse_distance('1,2 км', 'ru_RU') == 1.2
+    assert parse_distance('800 м', 'ru_RU') == 0.8
+    assert parse_distance('1,200 miles', 'en_US') == 1200
+    assert parse_distance(None, 'en_US') == math.inf
@@ -0,0 +1,37 @@
+import pytest
+
+from botrequests.serialization import COMPRESS_MIN_SIZE, Codec, msgpack
+
+PAGE = {
+    'total_count': 2,
+    'next_page': 2,
+    'results': [[101, 'Отель «Москва»', 4.0, 3500.5, '1,2 км', 'Тверская, 1'], [102, 'Hotel', None, 80, None, None]],
+}
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_json_round_trip(compression):
+    codec = Codec('json', compression)
+    assert Codec.decode(codec.encode(PAGE)) == PAGE
+
+
+@pytest.mark.skipif(msgpack is None, reason='msgpack is not installed')
+def test_msgpack_round_trip():
+    codec = Codec('msgpack', 'zlib')
+    assert Codec.decode(codec.encode(PAGE)) == PAGE
+
+
+def test_small_values_are_not_compressed():
+    assert Codec('json', 'zlib').encode({'a': 1})[1:2] == b'-'
+    large = {'results': ['hotel'] * COMPRESS_MIN_SIZE}
+    assert Codec('json', 'zlib').encode(large)[1:2] == b'z'
+
+
+def test_values_written_with_other_settings_are_read():
+    assert Codec('json', 'zlib').decode(Codec('json').encode(PAGE)) == PAGE
+
+
+@pytest.mark.parametrize('data', [b'', b'{"total_count":0}', b'jz not zlib'])
+def test_unknown_data_raises_value_error(data):
+    with pytest.raises(ValueError):
+        Codec.decode(data)
@@ -0,0 +1,47 @@
+from prometheus_client import REGISTRY
+
+from bot_redis import wizard_key
+from utils.metrics import STATE_COUNTS_KEY
+from utils.session import ChatSession
+
+CHAT_ID = 42
+
+
+def test_reads_are_buffered_and_written_on_flush(db):
+    chat = ChatSession(CHAT_ID)
+    chat.hset('language', 'en')
+    chat.hset(mapping={'state': '1', 'order': 'PRICE'})
+    assert db.hgetall(wizard_key(CHAT_ID)) == {}
+    assert chat.flush()
+    assert db.hgetall(wizard_key(CHAT_ID)) == {'state': '1', 'order': 'PRICE'}
+    assert ChatSession(CHAT_ID).hget('language') == 'en'
+
+
+def test_concurrent_state_change_is_discarded(db):
+    db.hset(wizard_key(CHAT_ID), mapping={'state': '1'})
+    first, second = ChatSession(CHAT_ID), ChatSession(CHAT_ID)
+    conflicts = REGISTRY.get_sample_value('bot_state_conflicts_total')
+
+    first.hset('state', '2')
+    assert first.flush()
+    second.hset(mapping={'state': '3', 'destination_id': '123'})
+    assert not second.flush()
+
+    assert db.hgetall(wizard_key(CHAT_ID)) == {'state': '2'}
+    assert REGISTRY.get_sample_value('bot_state_conflicts_total') == conflicts + 1
+
+
+def test_state_counts_follow_state_changes(db):
+    chat = ChatSession(CHAT_ID)
+    chat.hset('state', '1')
+    chat.flush()
+    chat = ChatSession(CHAT_ID)
+    chat.hset('state', '2')
+    chat.flush()
+    assert db.hgetall(STATE_COUNTS_KEY) == {'1': '0', '2': '1'}
+
+    chat = ChatSession(CHAT_ID)
+    chat.hset('state', '0')
+    chat.flush()
+    assert db.hgetall(wizard_key(CHAT_ID)) == {}
+    assert db.hgetall(STATE_COUNTS_KEY) == {'1': '0', '2': '0'}
@@ -0,0 +1,88 @@
+"""
+Runs CAS_STATE_SCRIPT itself: against the redis at TEST_REDIS_URL if it is reachable and against fakeredis with lua
+if it is installed (pip install "fakeredis[lua]<2"), the tests are skipped otherwise. The same scenarios run against
+the python stand-in used by the other tests, so it cannot drift from the script
+"""
+import os
+
+import pytest
+import redis
+
+from tests.helpers import memory_redis
+from utils.session import CAS_STATE_SCRIPT
+
+TEST_REDIS_URL = os.getenv('TEST_REDIS_URL', 'redis://localhost:6379/15')
+WIZARD = 'wizard:{42}'
+COUNTS = 'stats:states:{42}'
+
+
+def real_redis():
+    client = redis.Redis.from_url(TEST_REDIS_URL, decode_responses=True, socket_connect_timeout=0.5)
+    try:
+        client.ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip(f'redis is not reachable at {TEST_REDIS_URL}')
+    return client
+
+
+def fake_redis():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture(params=['redis', 'fakeredis', 'stand-in'])
+def client(request):
+    client = {'redis': real_redis, 'fakeredis': fake_redis, 'stand-in': memory_redis}[request.param]()
+    client.delete(WIZARD, COUNTS)
+    yield client
+    client.delete(WIZARD, COUNTS)
+
+
+def cas(client, expected: str, ttl: int = 60, counts: bool = True, **fields) -> int:
+    args = [expected, ttl]
+    for field, value in fields.items():
+        args.extend((field, value))
+    script = client.register_script(CAS_STATE_SCRIPT)
+    return script(keys=[WIZARD, COUNTS] if counts else [WIZARD], args=args)
+
+
+def test_sets_fields_of_a_new_wizard(client):
+    assert cas(client, '', state='1', order='PRICE') == 1
+    assert client.hgetall(WIZARD) == {'state': '1', 'order': 'PRICE'}
+    assert 0 < client.ttl(WIZARD) <= 60
+    assert client.hgetall(COUNTS) == {'1': '1'}
+
+
+def test_refuses_when_state_was_changed(client):
+    cas(client, '', state='1')
+    assert cas(client, '', state='2', order='PRICE') == 0
+    assert cas(client, '2', state='3') == 0
+    assert client.hgetall(WIZARD) == {'state': '1'}
+    assert client.hgetall(COUNTS) == {'1': '1'}
+
+
+def test_moves_chat_between_state_counters(client):
+    cas(client, '', state='1')
+    assert cas(client, '1', state='2', destination_id='123') == 1
+    assert client.hgetall(WIZARD) == {'state': '2', 'destination_id': '123'}
+    assert client.hgetall(COUNTS) == {'1': '0', '2': '1'}
+
+
+def test_fields_without_state_change_keep_counters(client):
+    cas(client, '', state='1')
+    assert cas(client, '1', state='1', order='PRICE') == 1
+    assert client.hgetall(COUNTS) == {'1': '1'}
+
+
+def test_idle_state_deletes_the_wizard(client):
+    cas(client, '', state='1')
+    assert cas(client, '1', state='0') == 1
+    assert client.exists(WIZARD) == 0
+    assert client.hgetall(COUNTS) == {'1': '0'}
+
+
+def test_counters_are_left_to_the_caller_without_second_key(client):
+    assert cas(client, '', counts=False, state='1') == 1
+    assert client.hgetall(WIZARD) == {'state': '1'}
+    assert client.exists(COUNTS) == 0
@@ -0,0 +1,16 @@
+from translations.templates import templates
+
+
+def test_parameters_are_escaped():
+    parameters = {
+        'destination_name': 'Saint <Louis> & Co',
+        'order': 'DISTANCE_FROM_LANDMARK',
+        'min_price': '100',
+        'max_price': '<500>',
+        'currency': 'USD',
+        'distance': '2&3',
+    }
+    message = templates['en'].render_parameters(parameters)
+    assert 'Saint &lt;Louis&gt; &amp; Co' in message
+    assert '&lt;500&gt;' in message and '2&amp;3' in message
+    assert message.startswith('<b>')
@@ -0,0 +1,79 @@
+from html import escape
+
+from translations.translations import vocabulary
+
+languages = tuple(vocabulary['hello'])
+
+
+class MessageTemplates:
+    """
+    Vocabulary of one language compiled into ready-made %-format strings, so a message is rendered with one format
+    operation
+    """
+
+    def __init__(self, lang: str) -> None:
+        self.lang = lang
+        self.words = {key: value[lang] for key, value in vocabulary.items()}
+        words = {key: value.replace('%', '%%') for key, value in self.words.items()}
+        self.no_information = self.words['no_information']
+        self.ratings = [self.no_information] + ['⭐' * stars for stars in range(1, 6)]
+        self.hotel_card = (
+            f"{words['hotel']}: %s\n"
+            f"{words['rating']}: %s\n"
+            f"{words['price']}: %s %s\n"
+            f"{words['distance']}: %s\n"
+            f"{words['address']}: %s\n"
+        )
+        self.parameters = (
+            f"<b>{words['parameters']}</b>\n"
+            f"{words['city']}: %s\n"
+        )
+        self.bestdeal_parameters = (
+            f"{words['price']}: %s - %s %s\n"
+            f"{words['max_distance']}: %s {words['dis_unit']}"
+        )
+
+    def rating(self, rating: float) -> str:
+        """
+        returns rating hotel in asterisks view
+        :param rating: hotel rating
+        :return: string like asterisks view hotel rating
+        """
+        if not rating:
+            return self.no_information
+        if rating < len(self.ratings):
+            return self.ratings[int(rating)]
+        return '⭐' * int(rating)
+
+    def render_hotel(self, hotel, currency: str) -> str:
+        """
+        renders hotel description
+        :param hotel: Hotel
+        :param currency: currency of hotel price
+        :return: string like hotel description
+        """
+        return self.hotel_card % (
+            escape(str(hotel.name), quote=False),
+            self.rating(hotel.star_rating),
+            hotel.price,
+            currency,
+            hotel.distance_text or self.no_information,
+            escape(str(hotel.address or self.no_information), quote=False),
+        )
+
+    def render_parameters(self, parameters: dict) -> str:
+        """
+        renders information about search parameters, the values come from the user and the api and are escaped, since
+        the header is sent in one message with the hotel cards
+        :param parameters: search parameters
+        :return: string like information about search parameters
+        """
+        message = self.parameters % escape(str(parameters['destination_name']), quote=False)
+        if parameters['order'] == 'DISTANCE_FROM_LANDMARK':
+            message += self.bestdeal_parameters % tuple(
+                escape(str(parameters[key]), quote=False) for key in ('min_price', 'max_price', 'currency', 'distance')
+            )
+        return message
+
+
+templates = {lang: MessageTemplates(lang) for lang in languages}
@@ -78,6 +78,18 @@ vocabulary = {
         'ru': 'К сожалению, не могу получить ответ от сервера. Повторите поиск позже.',
         'en': 'Sorry, I could not get a response from the server, please try again later.'
     },
+    'more_hotels': {
+        'ru': 'Показать еще',
+        'en': 'Show more',
+    },
+    'search_expired': {
+        'ru': 'Результаты этого поиска больше не хранятся. Пожалуйста, повторите поиск.',
+        'en': 'The results of this search are not stored any more. Please, search again.',
+    },
+    'busy': {
+        'ru': 'Сейчас слишком много запросов, я не успеваю их обработать. Пожалуйста, повторите поиск через минуту.',
+        'en': 'There are too many requests right now. Please, try the search again in a minute.'
+    },
     'distance': {
         'ru': 'Расстояние до центра города',
         'en': 'Distance to city center',
@@ -0,0 +1,55 @@
+from queue import Queue
+from threading import Thread
+
+from loguru import logger
+from telebot.types import Update
+
+
+def update_chat_id(update: Update) -> [int, None]:
+    """
+    returns id of the chat the update belongs to
+    :param update: Update
+    :return: chat id or None for updates without chat
+    """
+    if update.message:
+        return update.message.chat.id
+    if update.callback_query and update.callback_query.message:
+        return update.callback_query.message.chat.id
+    if update.edited_message:
+        return update.edited_message.chat.id
+    return None
+
+
+class ChatDispatcher:
+    """
+    Handles updates on a pool of worker threads, each with its own queue. The queue is chosen by chat id, so updates
+    of one chat are handled in the order they arrived and updates of different chats are handled in parallel
+    """
+
+    def __init__(self, handle, workers: int) -> None:
+        self.handle = handle
+        self.queues = [Queue() for _ in range(workers)]
+        for number, queue in enumerate(self.queues):
+            Thread(target=self._work, args=(queue,), name=f'dispatcher-{number}', daemon=True).start()
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def submit(self, update: Update) -> None:
+        """
+        puts update into the queue of its chat
+        :param update: Update
+        :return: None
+        """
+        chat_id = update_chat_id(update) or update.update_id
+        self.queues[chat_id % len(self.queues)].put(update)
+
+    def _work(self, queue: Queue) -> None:
+        while True:
+            update = queue.get()
+            with logger.contextualize(request_id=update.update_id, chat_id=update_chat_id(update)):
+                try:
+                    self.handle(update)
+                except Exception as e:
+                    logger.opt(exception=e).error(f'Error while handling update {update.update_id}: {e}')
@@ -1,11 +1,13 @@
-import re
+import os
+import random
 from datetime import datetime, timedelta
 
 from telebot.types import Message
 from loguru import logger
 
-from bot_redis import redis_db
+from translations.templates import templates, MessageTemplates
 from translations.translations import vocabulary
+from utils.session import get_session
 
 
 steps = {
@@ -23,21 +25,55 @@ locales = {
     "ru": "ru_RU",
     "en": "en_US"
 }
+MESSAGE_LIMIT = 4096
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_JSON = os.getenv('LOG_JSON', '1') == '1'
+LOG_PAYLOAD_LIMIT = int(os.getenv('LOG_PAYLOAD_LIMIT', 500))
+LOG_PAYLOAD_SAMPLE = float(os.getenv('LOG_PAYLOAD_SAMPLE', 0.01))
 
 logger_config = {
     "handlers": [
         {
             "sink": "logs/bot.log",
-            "format": "{time} | {level} | {message}",
+            "format": "{time} | {level} | {extra[request_id]} | {message}",
             "encoding": "utf-8",
-            "level": "DEBUG",
+            "level": LOG_LEVEL,
             "rotation": "5 MB",
-            "compression": "zip"
+            "compression": "zip",
+            "enqueue": True,
+            "serialize": LOG_JSON,
         },
     ],
+    "extra": {"request_id": "-", "chat_id": "-"},
 }
 
 
+def truncate(payload, limit: int = LOG_PAYLOAD_LIMIT) -> str:
+    """
+    returns string representation of the payload cut to the limit
+    :param payload: any object
+    :param limit: maximum length
+    :return: string
+    """
+    text = str(payload)
+    if len(text) > limit:
+        return f'{text[:limit]}... ({len(text)} chars)'
+    return text
+
+
+def log_payload(message: str, payload) -> None:
+    """
+    logs a large payload at DEBUG level for a sample of calls, the payload is truncated and formatted only if the
+    record is written
+    :param message: description of the payload
+    :param payload: any object
+    :return: None
+    """
+    if random.random() < LOG_PAYLOAD_SAMPLE:
+        logger.opt(lazy=True, depth=1).debug(message + ': {}', lambda: truncate(payload))
+
+
 def internationalize(key: str, msg: Message) -> str:
     """
     takes text in vocabulary in current language with key
@@ -45,13 +81,22 @@ def internationalize(key: str, msg: Message) -> str:
     :param msg: Message
     :return: text of message from vocabulary
     """
-    lang = redis_db.hget(msg.chat.id, 'language')
+    lang = get_session(msg.chat.id).hget('language')
     return vocabulary[key][lang]
 
 
 _ = internationalize
 
 
+def get_templates(msg: Message) -> MessageTemplates:
+    """
+    returns message templates in current language
+    :param msg: Message
+    :return: MessageTemplates
+    """
+    return templates[get_session(msg.chat.id).hget('language')]
+
+
 def is_input_correct(msg: Message) -> bool:
     """
 
@@ -59,7 +104,7 @@ def is_input_correct(msg: Message) -> bool:
     :param msg: Message
     :return: True if the message text is correct
     """
-    state = redis_db.hget(msg.chat.id, 'state')
+    state = get_session(msg.chat.id).hget('state')
     msg = msg.text.strip()
     if state == '4' and ' ' not in msg and msg.isdigit() and 0 < int(msg) <= 20:
         return True
@@ -77,22 +122,9 @@ def get_parameters_information(msg: Message) -> str:
     :param msg:
     :return: string like information about search parameters
     """
-    logger.info(f'Function {get_parameters_information.__name__} called with argument: {msg}')
-    parameters = redis_db.hgetall(msg.chat.id)
-    sort_order = parameters['order']
-    city = parameters['destination_name']
-    currency = parameters['currency']
-    message = (
-        f"<b>{_('parameters', msg)}</b>\n"
-        f"{_('city', msg)}: {city}\n"
-    )
-    if sort_order == "DISTANCE_FROM_LANDMARK":
-        price_min = parameters['min_price']
-        price_max = parameters['max_price']
-        distance = parameters['distance']
-        message += f"{_('price', msg)}: {price_min} - {price_max} {currency}\n" \
-                   f"{_('max_distance', msg)}: {distance} {_('dis_unit', msg)}"
-    logger.info(f'Search parameters: {message}')
+    parameters = get_session(msg.chat.id).hgetall()
+    message = templates[parameters['language']].render_parameters(parameters)
+    log_payload('Search parameters', message)
     return message
 
 
@@ -104,56 +136,61 @@ def make_message(msg: Message, prefix: str) -> str:
     :param prefix: prefix for key in vocabulary dictionary
     :return: string like message
     """
-    state = redis_db.hget(msg.chat.id, 'state')
+    session = get_session(msg.chat.id)
+    state = session.hget('state')
     message = _(prefix + state, msg)
     if state == '2':
-        message += f" ({redis_db.hget(msg.chat.id, 'currency')})"
+        message += f" ({session.hget('currency')})"
 
     return message
 
 
-def hotel_price(hotel: dict) -> int:
-    """
-    return hotel price
-    :param hotel: dict - hotel information
-    :return: integer or float like number
-    """
-
-    price = 0
-    try:
-        if hotel.get('ratePlan').get('price').get('exactCurrent'):
-            price = hotel.get('ratePlan').get('price').get('exactCurrent')
+def split_lines(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    splits a text longer than the limit on line breaks, so html tags and entities stay whole.
+    A line which is longer than the limit itself is cut at its last space before the limit
+    :param text: text to split
+    :param limit: maximum length of one piece
+    :return: list of lines
+    """
+    lines = []
+    for line in text.split('\n'):
+        while len(line) > limit:
+            cut = line.rfind(' ', 1, limit + 1)
+            cut = cut if cut > 0 else limit
+            lines.append(line[:cut])
+            line = line[cut:].lstrip(' ')
+        lines.append(line)
+    return lines
+
+
+def pack_messages(parts: list[str], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    packs texts into as few messages as possible, each no longer than the telegram limit
+    :param parts: texts in the order they should be sent
+    :param limit: maximum length of one message
+    :return: list of messages
+    """
+    messages = []
+    current = ''
+    for part in parts:
+        if len(part) > limit:
+            # a long text starts a new message, so the texts before it are sent before it
+            if current:
+                messages.append(current)
+                current = ''
+            pieces = split_lines(part, limit)
         else:
-            price = hotel.get('ratePlan').get('price').get('current')
-            price = int(re.sub(r'[^0-9]', '', price))
-    except Exception as e:
-        logger.warning(f'Hotel price getting error {e}')
-    return price
-
-
-def hotel_address(hotel: dict, msg: Message) -> str:
-    """
-    returns hotel address
-    :param msg: Message
-    :param hotel: dict - hotel information
-    :return: hotel address
-    """
-    message = _('no_information', msg)
-    if hotel.get('address'):
-        message = hotel.get('address').get('streetAddress', message)
-    return message
-
-
-def hotel_rating(rating: float, msg: Message) -> str:
-    """
-    returns rating hotel in asterisks view
-    :param rating: hotel rating
-    :param msg: Message
-    :return: string like asterisks view hotel rating
-    """
-    if not rating:
-        return _('no_information', msg)
-    return '⭐' * int(rating)
+            pieces = [part]
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > limit:
+                messages.append(current)
+                current = piece
+            else:
+                current = f'{current}\n{piece}' if current else piece
+    if current:
+        messages.append(current)
+    return messages
 
 
 def check_in_n_out_dates(check_in: datetime = None, check_out: datetime = None) -> dict:
@@ -181,14 +218,12 @@ def add_user(msg: Message) -> None:
     :param msg: Message
     :return: None
     """
-    logger.info("add_user called")
-    chat_id = msg.chat.id
+    logger.info('New user added')
     lang = msg.from_user.language_code
     if lang != 'ru':
         lang = 'en'
-    redis_db.hset(chat_id, mapping={
+    get_session(msg.chat.id).hset(mapping={
         "language": lang,
-        "state": 0,
         "locale": locales[lang],
         "currency": currencies[lang]
     })
@@ -200,9 +235,8 @@ def is_user_in_db(msg: Message) -> bool:
     :param msg: Message
     :return: True if user in database
     """
-    logger.info('is_user_in_db called')
-    chat_id = msg.chat.id
-    return redis_db.hget(chat_id, 'state') and redis_db.hget(chat_id, 'language')
+    session = get_session(msg.chat.id)
+    return session.hget('language') is not None
 
 
 def extract_search_parameters(msg: Message) -> dict:
@@ -211,8 +245,7 @@ def extract_search_parameters(msg: Message) -> dict:
     :param msg: Message
     :return: dict with search parameters
     """
-    logger.info(f"Function {extract_search_parameters.__name__} called")
-    params = redis_db.hgetall(msg.chat.id)
-    logger.info(f"parameters: {params}")
+    params = get_session(msg.chat.id).hgetall()
+    log_payload('Search parameters', params)
     return params
 
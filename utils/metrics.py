@@ -0,0 +1,124 @@
+import os
+
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import REGISTRY, GaugeMetricFamily
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+
+# redis hash with the number of chats in every search wizard state, kept by the state compare-and-set script
+STATE_COUNTS_KEY = 'stats:states'
+# redis hash with the number of keys and their memory by kind of keys, written by the sweeper
+MEMORY_REPORT_KEY = 'stats:memory'
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+stage_seconds = Histogram(
+    'bot_stage_seconds', 'Time spent in a stage of search handling', ['stage'], buckets=STAGE_BUCKETS,
+)
+telegram_request_seconds = Histogram(
+    'bot_telegram_request_seconds', 'Time of a Telegram Bot API request', ['method'], buckets=STAGE_BUCKETS,
+)
+telegram_send_seconds = Histogram(
+    'bot_telegram_send_seconds', 'Time from queueing a Telegram request to its delivery', buckets=STAGE_BUCKETS,
+)
+telegram_sends = Counter('bot_telegram_sends_total', 'Queued Telegram requests by outcome', ['event'])
+cache_events = Counter('bot_cache_events_total', 'Cache lookups by result', ['cache', 'event'])
+flight_calls = Counter(
+    'bot_singleflight_calls_total', 'Deduplicated calls, made or collapsed into a call in flight', ['flight', 'event'],
+)
+api_requests = Counter('bot_hotels_api_requests_total', 'Requests sent to the hotels api', ['endpoint'])
+api_errors = Counter('bot_hotels_api_errors_total', 'Failed hotels api requests', ['endpoint'])
+api_granted = Counter('bot_hotels_api_granted_total', 'Hotels api requests let through by the budget', ['priority'])
+api_refused = Counter('bot_hotels_api_refused_total', 'Hotels api requests refused by the budget', ['priority'])
+api_circuit_state = Gauge(
+    'bot_hotels_api_circuit_state', 'Circuit breaker state: 0 closed, 1 half-open, 2 open', ['endpoint'],
+)
+api_circuit_events = Counter(
+    'bot_hotels_api_circuit_events_total', 'Circuit breaker failures, openings and short-circuited calls',
+    ['endpoint', 'event'],
+)
+api_hedges = Counter('bot_hotels_api_hedges_total', 'Second attempts of slow hotels api requests', ['endpoint'])
+redis_calls = Counter('bot_redis_calls_total', 'Redis round-trips, a pipeline or a script call counts as one')
+update_redis_calls = Histogram(
+    'bot_update_redis_calls', 'Redis round-trips of the chat session of one update',
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24),
+)
+state_conflicts = Counter('bot_state_conflicts_total', 'Search wizard changes discarded by a concurrent change')
+queue_depth = Gauge('bot_queue_depth', 'Number of items waiting in a queue', ['queue'])
+
+
+def timed(stage: str):
+    """
+    returns decorator and context manager which observes the time of the stage
+    :param stage: stage name
+    :return: timer
+    """
+    return stage_seconds.labels(stage).time()
+
+
+class ConversationsCollector:
+    """
+    Reports the number of chats in every search wizard state, read from redis on every scrape, so all processes of
+    the bot report the same numbers
+    """
+
+    def collect(self):
+        from bot_redis import redis_db
+
+        family = GaugeMetricFamily('bot_conversations', 'Chats by search wizard state', labels=['state'])
+        try:
+            counts = redis_db.hgetall(STATE_COUNTS_KEY)
+        except Exception as e:
+            logger.warning(f'Could not read conversation states: {e}')
+            counts = {}
+        for state, count in sorted(counts.items()):
+            family.add_metric([state], max(int(count), 0))
+        yield family
+
+
+class MemoryCollector:
+    """
+    Reports redis keys and their memory by kind of keys, as estimated by the last sweep of any process
+    """
+
+    def collect(self):
+        from bot_redis import redis_db
+
+        keys = GaugeMetricFamily('bot_redis_keys', 'Redis keys by kind', labels=['kind'])
+        memory = GaugeMetricFamily('bot_redis_memory_bytes', 'Estimated redis memory by kind of keys', labels=['kind'])
+        per_user = GaugeMetricFamily('bot_redis_bytes_per_user', 'Estimated redis memory of chat state per user')
+        try:
+            report = redis_db.hgetall(MEMORY_REPORT_KEY)
+        except Exception as e:
+            logger.warning(f'Could not read redis memory report: {e}')
+            report = {}
+        for field, value in sorted(report.items()):
+            kind, _, measure = field.rpartition(':')
+            if measure == 'keys':
+                keys.add_metric([kind], float(value))
+            elif measure == 'bytes':
+                memory.add_metric([kind], float(value))
+            elif field == 'per_user':
+                per_user.add_metric([], float(value))
+        yield keys
+        yield memory
+        yield per_user
+
+
+def start_metrics_server() -> None:
+    """
+    serves /metrics on METRICS_HOST:METRICS_PORT, METRICS_PORT=0 disables the endpoint
+    :return: None
+    """
+    if not METRICS_PORT:
+        return
+    REGISTRY.register(ConversationsCollector())
+    REGISTRY.register(MemoryCollector())
+    try:
+        start_http_server(METRICS_PORT, METRICS_HOST)
+    except OSError as e:
+        logger.error(f'Metrics endpoint is not started on {METRICS_HOST}:{METRICS_PORT}: {e}')
+        return
+    logger.info(f'Metrics endpoint started on {METRICS_HOST}:{METRICS_PORT}')
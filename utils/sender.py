@@ -0,0 +1,219 @@
+import bisect
+import itertools
+import time
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+from loguru import logger
+from telebot.apihelper import ApiTelegramException
+
+from utils.metrics import telegram_request_seconds, telegram_send_seconds, telegram_sends
+
+INTERACTIVE = 0
+BULK = 1
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: rate tokens per second, at most capacity tokens at once
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        returns seconds until a token is available
+        :param now: monotonic time
+        :return: delay in seconds, 0 if a token is available now
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, seconds: float) -> None:
+        """
+        makes the bucket empty for the given number of seconds
+        :param seconds: number of seconds
+        :return: None
+        """
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Request:
+    __slots__ = ('priority', 'seq', 'chat_id', 'func', 'args', 'kwargs', 'future', 'enqueued')
+
+    def __init__(self, priority: int, seq: int, chat_id: int, func, args, kwargs) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other: '_Request') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SendQueue:
+    """
+    Outbound queue of telegram requests. Requests are sent by a few worker threads within the global and per-chat
+    rate limits, interactive requests go before bulk ones, requests of one chat keep their order within a priority.
+    "Too Many Requests" errors are retried after the retry_after given by telegram
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3, workers: int = 4) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(global_rate, global_rate)
+        self._buckets = {}
+        self._queue = []
+        self._busy = set()
+        self._seq = itertools.count()
+        self._cond = Condition()
+        for number in range(workers):
+            Thread(target=self._work, name=f'sender-{number}', daemon=True).start()
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def submit(self, chat_id: int, func, /, *args, priority: int = INTERACTIVE, **kwargs) -> Future:
+        """
+        puts a request into the queue
+        :param chat_id: chat the request is sent to
+        :param func: function which makes the request
+        :param priority: INTERACTIVE or BULK
+        :return: Future with the result of the request
+        """
+        request = _Request(priority, next(self._seq), chat_id, func, args, kwargs)
+        with self._cond:
+            bisect.insort(self._queue, request)
+            self._cond.notify()
+        return request.future
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune_buckets(self, now: float) -> None:
+        queued = {request.chat_id for request in self._queue} | self._busy
+        for chat_id in [chat_id for chat_id, bucket in self._buckets.items()
+                        if chat_id not in queued and bucket.is_full(now)]:
+            del self._buckets[chat_id]
+
+    def _next(self) -> _Request:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._global.delay(now) or None
+                if wait is None:
+                    for index, request in enumerate(self._queue):
+                        if request.chat_id in self._busy:
+                            continue
+                        delay = self._bucket(request.chat_id).delay(now)
+                        if delay == 0:
+                            del self._queue[index]
+                            self._global.take()
+                            self._bucket(request.chat_id).take()
+                            self._busy.add(request.chat_id)
+                            return request
+                        wait = delay if wait is None else min(wait, delay)
+                if len(self._buckets) > 10000:
+                    self._prune_buckets(now)
+                self._cond.wait(wait)
+
+    def _work(self) -> None:
+        while True:
+            request = self._next()
+            retry = False
+            try:
+                with telegram_request_seconds.labels(request.func.__name__).time():
+                    result = request.func(*request.args, **request.kwargs)
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry = True
+                    retry_after = e.result_json.get('parameters', {}).get('retry_after', 1)
+                    logger.warning(f'Too many requests to chat {request.chat_id}, retry after {retry_after} s')
+                    with self._cond:
+                        self._bucket(request.chat_id).block(retry_after)
+                        bisect.insort(self._queue, request)
+                    telegram_sends.labels('retried').inc()
+                else:
+                    self._fail(request, e)
+            except Exception as e:
+                self._fail(request, e)
+            else:
+                request.future.set_result(result)
+                telegram_sends.labels('sent').inc()
+                telegram_send_seconds.observe(time.monotonic() - request.enqueued)
+            finally:
+                with self._cond:
+                    self._busy.discard(request.chat_id)
+                    if retry:
+                        self._cond.notify_all()
+                    else:
+                        self._cond.notify()
+
+    def _fail(self, request: _Request, error: Exception) -> None:
+        logger.error(f'Request to chat {request.chat_id} failed: {error}')
+        request.future.set_exception(error)
+        telegram_sends.labels('failed').inc()
+
+
+class OutboundBot:
+    """
+    Sends messages of the bot through the SendQueue, the methods return Futures instead of results
+    """
+
+    def __init__(self, bot, queue: SendQueue) -> None:
+        self.bot = bot
+        self.queue = queue
+
+    def send_message(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs) -> Future:
+        return self.queue.submit(chat_id, self.bot.send_message, chat_id, text, priority=priority, **kwargs)
+
+    def delete_message(self, chat_id: int, message, priority: int = INTERACTIVE) -> Future:
+        """
+        deletes message
+        :param chat_id: chat id
+        :param message: Message or Future of a message sent through the queue
+        :param priority: INTERACTIVE or BULK
+        :return: Future
+        """
+        def delete_message():
+            sent = message.result() if isinstance(message, Future) else message
+            return self.bot.delete_message(chat_id, sent.message_id)
+
+        return self.queue.submit(chat_id, delete_message, priority=priority)
+
+    def edit_message_reply_markup(self, chat_id: int, message_id: int, reply_markup=None,
+                                  priority: int = INTERACTIVE) -> Future:
+        return self.queue.submit(
+            chat_id,
+            self.bot.edit_message_reply_markup,
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=reply_markup,
+            priority=priority,
+        )
@@ -0,0 +1,236 @@
+import os
+from contextvars import ContextVar
+from functools import wraps
+
+from loguru import logger
+from telebot.types import CallbackQuery
+
+from bot_redis import is_cluster, migrations, redis_db, user_key, wizard_key
+from utils.metrics import STATE_COUNTS_KEY, state_conflicts, update_redis_calls
+
+WIZARD_TTL = int(os.getenv('WIZARD_TTL', 6 * 60 * 60))
+PREFERENCES_TTL = int(os.getenv('PREFERENCES_TTL', 180 * 24 * 60 * 60))
+
+_current_session = ContextVar('chat_session', default=None)
+
+# user preferences are stored in one string of the indices of their values, e.g. "0,0,1", a value missing here is
+# stored as is
+PREFERENCES = {
+    'language': ('ru', 'en'),
+    'locale': ('ru_RU', 'en_US'),
+    'currency': ('RUB', 'USD', 'EUR'),
+}
+
+# sets the fields of the search wizard hash only if its state has not been changed since the hash was loaded and
+# moves the chat between the per-state counters in KEYS[2]. The hash of an idle chat is deleted, the others expire
+# after ARGV[2] seconds. In a cluster KEYS[2] is in another hash slot, so it is not passed and the counters are
+# updated by the caller. unpack is table.unpack in lua 5.4, which fakeredis runs in the tests
+CAS_STATE_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state') or ''
+if state ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], (unpack or table.unpack)(ARGV, 3))
+local new_state = redis.call('HGET', KEYS[1], 'state')
+if new_state == '0' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+if #KEYS > 1 and new_state ~= state then
+    if state ~= '' and state ~= '0' then
+        redis.call('HINCRBY', KEYS[2], state, -1)
+    end
+    if new_state ~= '0' then
+        redis.call('HINCRBY', KEYS[2], new_state, 1)
+    end
+end
+return 1
+"""
+cas_state = redis_db.register_script(CAS_STATE_SCRIPT)
+
+
+def encode_preferences(data: dict) -> str:
+    """
+    encodes user preferences into a short string
+    :param data: fields of the session
+    :return: string like "0,0,1"
+    """
+    values = []
+    for field, options in PREFERENCES.items():
+        value = data.get(field, '')
+        values.append(str(options.index(value)) if value in options else value)
+    return ','.join(values)
+
+
+def decode_preferences(value: [str, None]) -> dict:
+    """
+    decodes user preferences encoded by encode_preferences
+    :param value: encoded preferences, None for an unknown user
+    :return: dict of the preferences which are set
+    """
+    if not value:
+        return {}
+    data = {}
+    for (field, options), item in zip(PREFERENCES.items(), value.split(',')):
+        if item.isdigit() and int(item) < len(options):
+            data[field] = options[int(item)]
+        elif item:
+            data[field] = item
+    return data
+
+
+class ChatSession:
+    """
+    In-memory view of the chat for the duration of one update: the user preferences, kept for PREFERENCES_TTL since
+    the last update, and the search wizard hash, which expires after WIZARD_TTL and is deleted when the search is
+    done. Both are loaded with one pipeline, reads are served from memory and changed fields are written back on
+    flush. If the update changes the search wizard state, the write is a compare-and-set on the state loaded at the
+    start of the update
+    """
+
+    def __init__(self, chat_id: int, buffered: bool = True) -> None:
+        self.chat_id = chat_id
+        self.key = user_key(chat_id)
+        self.wizard_key = wizard_key(chat_id)
+        self.buffered = buffered
+        self.redis_calls = 0
+        self._changed = set()
+        pipe = redis_db.pipeline(transaction=False)
+        pipe.get(self.key)
+        pipe.hgetall(self.wizard_key)
+        pipe.expire(self.key, PREFERENCES_TTL)
+        preferences, wizard, _ = self._call(pipe.execute)
+        self._data = {**wizard, **decode_preferences(preferences)}
+        self._loaded_state = self._data.get('state', '')
+
+    def _call(self, func, *args, **kwargs):
+        self.redis_calls += 1
+        return func(*args, **kwargs)
+
+    def hget(self, key: str) -> [str, None]:
+        return self._data.get(key)
+
+    def hgetall(self) -> dict:
+        return dict(self._data)
+
+    def hset(self, key: str = None, value=None, mapping: dict = None) -> None:
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        items = {field: str(item) for field, item in items.items()}
+        self._data.update(items)
+        self._changed.update(items)
+        if not self.buffered:
+            self.flush()
+
+    def hincrby(self, key: str, amount: int = 1) -> int:
+        value = int(self._data.get(key) or 0) + amount
+        self.hset(key, value)
+        return value
+
+    def flush(self) -> bool:
+        """
+        writes changed fields to redis. If the state was changed, the wizard fields are written only if nobody else
+        has changed the state since the hash was loaded
+        :return: False if the wizard changes were discarded because of a concurrent state change
+        """
+        if not self._changed:
+            return True
+        changed, self._changed = self._changed, set()
+        wizard = {field: self._data[field] for field in changed if field not in PREFERENCES}
+        write_preferences = len(wizard) < len(changed)
+        write_wizard = wizard and 'state' not in wizard
+        if write_preferences or write_wizard:
+            pipe = redis_db.pipeline(transaction=False)
+            if write_preferences:
+                pipe.set(self.key, encode_preferences(self._data), ex=PREFERENCES_TTL)
+            if write_wizard:
+                pipe.hset(self.wizard_key, mapping=wizard)
+                pipe.expire(self.wizard_key, WIZARD_TTL)
+            self._call(pipe.execute)
+        if 'state' not in wizard:
+            return True
+
+        args = [self._loaded_state, WIZARD_TTL]
+        for field, value in wizard.items():
+            args.extend((field, value))
+        keys = [self.wizard_key] if is_cluster else [self.wizard_key, STATE_COUNTS_KEY]
+        if self._call(cas_state, keys=keys, args=args):
+            if is_cluster and wizard['state'] != self._loaded_state:
+                self._count_state(self._loaded_state, wizard['state'])
+            # the hash of an idle chat is deleted by the script
+            self._loaded_state = wizard['state'] if wizard['state'] != '0' else ''
+            return True
+        logger.warning(f'State of chat {self.chat_id} was changed concurrently, changes discarded: {wizard}')
+        state_conflicts.inc()
+        return False
+
+    def _count_state(self, state: str, new_state: str) -> None:
+        pipe = redis_db.pipeline(transaction=False)
+        if state not in ('', '0'):
+            pipe.hincrby(STATE_COUNTS_KEY, state, -1)
+        if new_state != '0':
+            pipe.hincrby(STATE_COUNTS_KEY, new_state, 1)
+        self._call(pipe.execute)
+
+
+def get_session(chat_id: int) -> ChatSession:
+    """
+    returns the session of the update being handled; outside of a handler returns an unbuffered session
+    :param chat_id: chat id
+    :return: ChatSession
+    """
+    session = _current_session.get()
+    if session is None or session.chat_id != chat_id:
+        return ChatSession(chat_id, buffered=False)
+    return session
+
+
+def chat_session(handler):
+    """
+    decorator for update handlers, opens a chat session for the update and flushes it when the handler returns
+    :param handler: message or callback query handler
+    :return: wrapped handler
+    """
+    @wraps(handler)
+    def wrapper(update, *args, **kwargs):
+        msg = update.message if isinstance(update, CallbackQuery) else update
+        session = ChatSession(msg.chat.id)
+        token = _current_session.set(session)
+        try:
+            return handler(update, *args, **kwargs)
+        finally:
+            _current_session.reset(token)
+            session.flush()
+            update_redis_calls.observe(session.redis_calls)
+            logger.debug(f'Redis calls for update in chat {session.chat_id}: {session.redis_calls}')
+
+    return wrapper
+
+
+def split_user_hashes(client) -> int:
+    """
+    migrates user hashes to the preferences string and the search wizard hash, the wizard of an idle chat is dropped
+    :param client: redis client with decoded responses
+    :return: number of migrated users
+    """
+    migrated = 0
+    for key in client.scan_iter(match='user:*', count=1000):
+        if client.type(key) != 'hash':
+            continue
+        data = client.hgetall(key)
+        wizard = {field: value for field, value in data.items() if field not in PREFERENCES}
+        pipe = client.pipeline(transaction=False)
+        pipe.delete(key)
+        pipe.set(key, encode_preferences(data), ex=PREFERENCES_TTL)
+        if wizard.get('state', '0') != '0':
+            chat_id = key[len('user:{'):-1]
+            pipe.hset(wizard_key(chat_id), mapping=wizard)
+            pipe.expire(wizard_key(chat_id), WIZARD_TTL)
+        pipe.execute()
+        migrated += 1
+    return migrated
+
+
+migrations[3] = split_user_hashes
@@ -0,0 +1,122 @@
+import os
+import time
+from collections import Counter, defaultdict
+from threading import Thread
+
+from loguru import logger
+
+from bot_redis import redis_db
+from utils.metrics import MEMORY_REPORT_KEY, STATE_COUNTS_KEY, timed
+
+SWEEPER_ENABLED = os.getenv('SWEEPER_ENABLED', '1') == '1'
+SWEEPER_INTERVAL = int(os.getenv('SWEEPER_INTERVAL', 10 * 60))
+SWEEPER_SAMPLE = int(os.getenv('SWEEPER_SAMPLE', 200))
+
+# kinds of keys by prefix, keys with other prefixes are reported as "other"
+KEY_KINDS = ('user', 'wizard', 'search', 'cache', 'stats')
+# keys of chat state, their memory divided by the number of users is the memory per active user
+CHAT_KINDS = ('user', 'wizard')
+SWEEPER_LOCK = 'sweeper:lock'
+BATCH = 1000
+
+
+def batched(items: list, size: int = BATCH):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def count_states(wizards: list) -> Counter:
+    """
+    counts the chats in every search wizard state
+    :param wizards: keys of the search wizard hashes
+    :return: Counter of states
+    """
+    states = Counter()
+    for keys in batched(wizards):
+        pipe = redis_db.pipeline(transaction=False)
+        for key in keys:
+            pipe.hget(key, 'state')
+        states.update(state for state in pipe.execute() if state not in (None, '0'))
+    return states
+
+
+def estimate_memory(sample: list, count: int) -> int:
+    """
+    estimates the memory of the keys of one kind from the memory of a sample of them
+    :param sample: keys to measure
+    :param count: number of keys of the kind
+    :return: bytes
+    """
+    if not sample:
+        return 0
+    pipe = redis_db.pipeline(transaction=False)
+    for key in sample:
+        pipe.memory_usage(key)
+    sizes = [size for size in pipe.execute() if size is not None]
+    return sum(sizes) * count // len(sizes) if sizes else 0
+
+
+@timed('sweep')
+def sweep() -> [dict, None]:
+    """
+    scans the keys once, recounts the chats in every search wizard state, because the counters are not decreased
+    when a wizard expires, and estimates the memory of every kind of keys from MEMORY USAGE of a sample of
+    SWEEPER_SAMPLE keys. Only one process sweeps in an interval
+    :return: report {kind: {'keys': number, 'bytes': memory}, 'per_user': bytes}, None if swept by another process
+    """
+    if not redis_db.set(SWEEPER_LOCK, 1, nx=True, ex=max(SWEEPER_INTERVAL - 1, 1)):
+        return None
+    keys = Counter()
+    samples = defaultdict(list)
+    wizards = []
+    for key in redis_db.scan_iter(count=BATCH):
+        kind = key.split(':', 1)[0]
+        kind = kind if kind in KEY_KINDS else 'other'
+        keys[kind] += 1
+        if len(samples[kind]) < SWEEPER_SAMPLE:
+            samples[kind].append(key)
+        if kind == 'wizard':
+            wizards.append(key)
+
+    states = count_states(wizards)
+    report = {kind: {'keys': count, 'bytes': estimate_memory(samples[kind], count)} for kind, count in keys.items()}
+    chat_bytes = sum(report[kind]['bytes'] for kind in CHAT_KINDS if kind in report)
+    report['per_user'] = chat_bytes // keys['user'] if keys['user'] else 0
+
+    mapping = {'per_user': report['per_user']}
+    for kind, usage in report.items():
+        if kind != 'per_user':
+            mapping[f'{kind}:keys'] = usage['keys']
+            mapping[f'{kind}:bytes'] = usage['bytes']
+    # chats which change state during the scan may be counted wrong until the next sweep
+    # one key per delete, a cluster pipeline does not delete several keys in one command
+    pipe = redis_db.pipeline()
+    pipe.delete(STATE_COUNTS_KEY)
+    pipe.delete(MEMORY_REPORT_KEY)
+    if states:
+        pipe.hset(STATE_COUNTS_KEY, mapping=states)
+    pipe.hset(MEMORY_REPORT_KEY, mapping=mapping)
+    pipe.execute()
+
+    logger.info(f"Redis sweep: {keys['user']} users, {len(wizards)} search wizards, {report['per_user']} B per user; "
+                + ', '.join(f"{kind} {usage['keys']} keys {usage['bytes'] / 1024:.1f} KB"
+                            for kind, usage in sorted(report.items()) if kind != 'per_user'))
+    return report
+
+
+def run_sweeper() -> None:
+    while True:
+        try:
+            sweep()
+        except Exception as e:
+            logger.opt(exception=True).error(f'Redis sweep failed: {e}')
+        time.sleep(SWEEPER_INTERVAL)
+
+
+def start_sweeper() -> None:
+    """
+    starts the thread which sweeps redis every SWEEPER_INTERVAL seconds
+    :return: None
+    """
+    if SWEEPER_ENABLED:
+        Thread(target=run_sweeper, name='sweeper', daemon=True).start()
@@ -0,0 +1,41 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+from telebot.types import Update
+
+from utils.dispatcher import ChatDispatcher
+
+
+def make_webhook_server(host: str, port: int, path: str, dispatcher: ChatDispatcher) -> ThreadingHTTPServer:
+    """
+    creates http server that receives telegram updates on the path and passes them to the dispatcher. Updates of one
+    chat keep their order only if telegram sends them over one connection to one process, see WEBHOOK_MAX_CONNECTIONS
+    :param host: interface to listen on
+    :param port: port to listen on
+    :param path: secret path telegram sends updates to
+    :param dispatcher: ChatDispatcher
+    :return: ThreadingHTTPServer
+    """
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            if self.path != path:
+                self.send_error(403)
+                return
+            try:
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                update = Update.de_json(json.loads(body))
+            except (ValueError, TypeError) as e:
+                logger.warning(f'Bad webhook request: {e}')
+                self.send_error(400)
+                return
+            dispatcher.submit(update)
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format: str, *args) -> None:
+            logger.debug(f'Webhook {self.address_string()}: {format % args}')
+
+    return ThreadingHTTPServer((host, port), WebhookHandler)